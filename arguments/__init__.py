@@ -64,6 +64,9 @@ class ModelParams(ParamGroup):
         self.detect_th = 0.0
         self.mlp_dim = 16
         self.mlp_name = "7scenes_stairs"
+        self.compile_encoder = False
+        self.feature_batch_size = 1
+        self.seed = 0
 ##################################################
         self.render_items = ['RGB', 'Depth', 'Edge', 'Normal', 'Curvature', 'Feature Map', 'Score Map']
         super().__init__(parser, "Loading Parameters", sentinel)
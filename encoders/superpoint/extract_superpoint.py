@@ -1,11 +1,15 @@
 import torch
 import argparse
+import hashlib
 import os
+from torch.utils.data import DataLoader
 from .superpoint import SuperPoint
-from .utils import load_image, resize_image
-from ...mlp.mlp import get_mlp_model
+from .utils import ImageFolder, AsyncSaver, shape_batches
+from ...mlp.mlp import get_mlp_model, encode_dense, quantize_mlp_int8
 from torchvision.transforms import ToPILImage
 
+torch.backends.cudnn.benchmark = True
+
 
 
 
@@ -28,6 +32,12 @@ parser.add_argument(
 )
 parser.add_argument("--resize", type=int, default=None, help="if resize image.")
 parser.add_argument("--device", type=str, default="cuda", help="The device to run generation on.")
+parser.add_argument("--batch_size", type=int, default=8, help="Number of same-size images per forward pass.")
+parser.add_argument("--compile", action="store_true", help="torch.compile SuperPoint and the MLP.")
+parser.add_argument("--trt", action="store_true", help="Run SuperPoint through a cached fp16 TensorRT engine.")
+parser.add_argument("--trt_cache", type=str, default=None, help="Folder for TensorRT engines, defaults to --output.")
+parser.add_argument("--int8", action="store_true", help="Run the descriptor MLP with int8 weights and activations.")
+parser.add_argument("--num_workers", type=int, default=4, help="Workers used to decode and resize images.")
 
 
 
@@ -41,53 +51,117 @@ def saveimage_from_torch(image: torch.Tensor, img_name = "image"):
 
 
 
-def main(args):
-    print("Loading model...")
-    model = SuperPoint({}).to(args.device)
-    mlp, ckpt_path = get_mlp_model()
-    mlp = mlp()
-    ckpt = torch.load(ckpt_path)
-    mlp.load_state_dict(ckpt)
-    mlp.to(args.device)
+class DenseSuperPoint(torch.nn.Module):
+    # tensor in / tensors out view of the dense SuperPoint heads, so it can be traced
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
 
+    def forward(self, image):
+        pred = self.model({"image": image})
+        return pred['descriptors'], pred['keypoint_scores']
 
-    targets = [f for f in os.listdir(args.input) if not os.path.isdir(os.path.join(args.input, f))]
-    targets = [os.path.join(args.input, f) for f in targets]
 
-    os.makedirs(args.output, exist_ok=True)
+def weights_digest(model):
+    sha = hashlib.sha1()
+    for name, tensor in model.state_dict().items():
+        sha.update(name.encode())
+        sha.update(tensor.detach().float().cpu().numpy().tobytes())
+    return sha.hexdigest()[:12]
+
 
-    for t in targets:
-        print(f"Processing '{t}'...")
-        img_name = t.split(os.sep)[-1].split(".")[0]
-        image = load_image(t).to(args.device)
+class TRTSuperPoint:
+    # one fp16 engine per static batch shape, serialized next to the outputs
+    def __init__(self, model, cache_dir):
+        import torch_tensorrt
+        self.torch_tensorrt = torch_tensorrt
+        self.digest = weights_digest(model)
+        self.model = DenseSuperPoint(model).half()
+        self.cache_dir = cache_dir
+        self.engines = {}
 
-        if args.resize is not None:
-            resize = args.resize
-            h, w = image.shape[1:]
-            ratio = h/w
-            size = [int(resize*ratio), resize]
-            image = resize_image(image, size)
+    def engine(self, shape):
+        if shape not in self.engines:
+            # keyed on the weights too, so a changed checkpoint never reuses a stale engine
+            path = os.path.join(self.cache_dir, f"superpoint_{self.digest}_{'x'.join(map(str, shape))}.ts")
+            if os.path.exists(path):
+                self.engines[shape] = torch.jit.load(path)
+            else:
+                example = torch.randn(shape, dtype=torch.half, device="cuda")
+                traced = torch.jit.trace(self.model, example)
+                self.engines[shape] = self.torch_tensorrt.compile(
+                    traced, inputs=[self.torch_tensorrt.Input(shape, dtype=torch.half)],
+                    enabled_precisions={torch.half})
+                torch.jit.save(self.engines[shape], path)
+        return self.engines[shape]
 
+    def __call__(self, data):
+        image = data["image"]
+        desc, scores = self.engine(tuple(image.shape))(image.half())
+        return {'descriptors': desc.float(), 'keypoint_scores': scores.float()}
 
-        image = image.unsqueeze(0)
-        
-        if image is None:
-            print(f"Could not load '{t}' as an image, skipping...")
-            continue
-        
-        pred = model(image)
-        desc = pred['descriptors'][0]
-        scores = pred['keypoint_scores'][0]
 
-        desc_mlp = mlp(desc.permute(1,2,0)).permute(2,0,1).contiguous()
+def extract_batch(model, encode, mlp, names, images, args, saver):
+    batch = torch.stack(images).to(args.device, non_blocking=True)
+    batch = batch.contiguous(memory_format=torch.channels_last)
+    pred = model({"image": batch})
+    desc = pred['descriptors']
+    scores = pred['keypoint_scores']
 
+    desc_mlp = encode(mlp, desc).half()
+
+    for i, img_name in enumerate(names):
         print(f'{img_name}: ')
-        print("descriptors shape: ", desc_mlp.shape)
-        print("scores shape: ", scores.shape)
+        print("descriptors shape: ", desc_mlp[i].shape)
+        print("scores shape: ", scores[i].shape)
+
+        saver.save(desc_mlp[i], os.path.join(args.output, f"{img_name}_fmap_CxHxW.pt"))
+        saver.save(scores[i], os.path.join(args.output, f"{img_name}_smap_CxH8xW8.pt"))
 
 
-        torch.save(desc_mlp, os.path.join(args.output, f"{img_name}_fmap_CxHxW.pt"))
-        torch.save(scores, os.path.join(args.output, f"{img_name}_smap_CxH8xW8.pt"))
+def main(args):
+    print("Loading model...")
+    model = SuperPoint({"sparse_outputs": False}).to(args.device).eval()
+    model = model.to(memory_format=torch.channels_last)
+    mlp = get_mlp_model().to(args.device).eval()
+    if args.int8:
+        mlp = quantize_mlp_int8(mlp)
+    trt_model = None
+    if args.trt:
+        try:
+            trt_model = TRTSuperPoint(model, args.trt_cache or args.output)
+        except ImportError:
+            print("torch_tensorrt not found, falling back to torch.compile")
+            args.compile = True
+    if trt_model is not None:
+        model = trt_model
+    elif args.compile:
+        # shapes are fixed per bucket, so each resolution compiles once
+        model = torch.compile(model, dynamic=False)
+    encode = encode_dense
+    if args.compile:
+        # encode_dense walks mlp.MLP itself, so compile it rather than mlp.forward
+        encode = torch.compile(encode_dense, mode="reduce-overhead", dynamic=False)
+
+
+    targets = [f for f in os.listdir(args.input) if not os.path.isdir(os.path.join(args.input, f))]
+    targets = [os.path.join(args.input, f) for f in targets]
+
+    os.makedirs(args.output, exist_ok=True)
+    if args.trt_cache is not None:
+        os.makedirs(args.trt_cache, exist_ok=True)
+
+    loader = DataLoader(ImageFolder(targets, args.resize), batch_size=None, shuffle=False,
+                        num_workers=args.num_workers, pin_memory=True)
+
+    saver = AsyncSaver(max_workers=4)
+    try:
+        with torch.inference_mode():
+            for names, images in shape_batches(loader, args.batch_size):
+                extract_batch(model, encode, mlp, names, images, args, saver)
+    finally:
+        # re-raises a failed write (disk full, permissions) instead of dropping it
+        saver.close()
 
 
 
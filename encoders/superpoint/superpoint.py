@@ -245,10 +245,10 @@ class SuperPoint(nn.Module):
                 keypoints = pad_and_stack(keypoints, max_kps, -2, mode="random_c",
                                             bounds=(0, data.get("image_size", torch.tensor(image.shape[-2:])).min().item(),),)
                 scores = pad_and_stack(scores, max_kps, -1, mode="zeros")
-            else:
+            elif all(len(k) == len(keypoints[0]) for k in keypoints):
                 keypoints = torch.stack(keypoints, 0)
                 scores = torch.stack(scores, 0)
-            if (len(keypoints) == 1) or self.conf.force_num_keypoints:
+            if torch.is_tensor(keypoints):
                 if self.conf.legacy_sampling:
                     desc = sample_descriptors(keypoints, dense_desc, 8)
                 else:
@@ -260,10 +260,17 @@ class SuperPoint(nn.Module):
                 else:
                     desc = [sample_descriptors_fix_sampling(k[None], d[None], 8)[0] 
                             for k, d in zip(keypoints, dense_desc)]
+            # batches with differing keypoint counts stay as per-image lists
+            if torch.is_tensor(keypoints):
+                keypoints = keypoints + 0.5
+                desc = desc.transpose(-1, -2)
+            else:
+                keypoints = [k + 0.5 for k in keypoints]
+                desc = [d.transpose(-1, -2) for d in desc]
             pred = {
-                "keypoints": keypoints + 0.5,
+                "keypoints": keypoints,
                 "keypoint_scores": scores,
-                "descriptors": desc.transpose(-1, -2),
+                "descriptors": desc,
             }
             if self.conf.dense_outputs:
                 pred["dense_descriptors"] = dense_desc
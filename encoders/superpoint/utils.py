@@ -1,6 +1,10 @@
+import os
 import math
 from typing import List, Optional, Tuple
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import torch
+from torch.utils.data import Dataset
 from pathlib import Path
 import cv2
 import numpy as np
@@ -83,11 +87,21 @@ def numpy_image_to_torch(image: np.ndarray) -> torch.Tensor:
     return torch.tensor(image / 255.0, dtype=torch.float)
 
 
-def load_image(path: Path, grayscale=False) -> torch.Tensor:
+def load_image(path: Path, grayscale=False, resize=None) -> torch.Tensor:
     image = read_image(path, grayscale=grayscale)
+    if resize is not None:
+        # resize to the given width while keeping the aspect ratio
+        h, w = image.shape[:2]
+        image = resize_image_cv2(image, [int(resize*h/w), resize])
     return numpy_image_to_torch(image)
 
 
+def resize_image_cv2(image: np.ndarray, size: list) -> np.ndarray:
+    h, w = image.shape[:2]
+    interpolation = cv2.INTER_AREA if size[0]*size[1] < h*w else cv2.INTER_LINEAR
+    return cv2.resize(np.ascontiguousarray(image), (size[1], size[0]), interpolation=interpolation)
+
+
 def resize_image(image: torch.Tensor, size: list):
     image = kornia.geometry.transform.resize(
                 image,
@@ -100,6 +114,85 @@ def resize_image(image: torch.Tensor, size: list):
     return image
 
 
+class ImageFolder(Dataset):
+    """(name, image) per file for a DataLoader; image is None when the file cannot be read."""
+    def __init__(self, targets, resize=None, loader=load_image):
+        self.targets = targets
+        self.resize = resize
+        self.loader = loader
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, idx):
+        t = self.targets[idx]
+        img_name = t.split(os.sep)[-1].split(".")[0]
+        try:
+            image = self.loader(t, resize=self.resize)
+        except OSError:
+            return img_name, None
+        return img_name, image
+
+
+def shape_batches(loader, batch_size):
+    """
+    Group the (name, image) items of an ImageFolder loader into same-shape batches.
+
+    Yields:
+        (names, images) lists of at most batch_size items; images only share a forward
+        pass when their resized shape matches. Unreadable images are skipped.
+    """
+    buckets = defaultdict(lambda: ([], []))
+    for img_name, image in loader:
+        if image is None:
+            print(f"Could not load '{img_name}' as an image, skipping...")
+            continue
+        print(f"Processing '{img_name}'...")
+        shape = tuple(image.shape)
+        names, images = buckets[shape]
+        names.append(img_name)
+        images.append(image)
+        if len(images) == batch_size:
+            del buckets[shape]
+            yield names, images
+    yield from buckets.values()
+
+
+class AsyncSaver:
+    """
+    torch.save on worker threads. GPU tensors are staged into pinned memory so the D2H
+    copy does not block the next forward; close() waits for every write and re-raises
+    the first one that failed.
+    """
+    def __init__(self, max_workers=4):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = []
+
+    def save(self, tensor, path):
+        if tensor.is_cuda:
+            staged = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+            staged.copy_(tensor, non_blocking=True)
+            done = torch.cuda.Event()
+            done.record()
+        else:
+            # a compact copy; saving a view would write its whole batch storage
+            staged, done = tensor.clone(), None
+
+        def _save():
+            if done is not None:
+                done.synchronize()
+            torch.save(staged, path)
+
+        self.futures.append(self.pool.submit(_save))
+
+    def close(self):
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.pool.shutdown(wait=True)
+
+
 # python -m encoders.superpoint.utils
 if __name__=="__main__":
     x=torch.load('/home/koki/code/feature_3dgs/scene000000_B/sam_embeddings/3364_fmap_CxHxW.pt')
@@ -35,11 +35,13 @@ elif mlp_dim==64:
 from utils.sh_utils import eval_sh
 
 
-def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, override_color = None):
+def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, override_color = None,
+           produce_feature = True, produce_score = True):
     """
     Render the scene. 
     
     Background tensor (bg_color) must be on GPU!
+    produce_feature / produce_score = False skip rasterizing that map, it is returned as None.
     """
  
     # Create zero tensor. We will use it to make pytorch return gradients of the 2D (screen-space) means
@@ -51,6 +53,10 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
     # Set up rasterization configuration
     tanfovx = math.tan(viewpoint_camera.FoVx * 0.5)
     tanfovy = math.tan(viewpoint_camera.FoVy * 0.5)
+    # only the feature_test build can skip maps; the other builds rasterize them and they are dropped below
+    skip_maps = {}
+    if "render_feature" in GaussianRasterizationSettings._fields and not (produce_feature and produce_score):
+        skip_maps = {"render_feature": produce_feature, "render_score": produce_score}
     raster_settings = GaussianRasterizationSettings(
         image_height=int(viewpoint_camera.image_height),
         image_width=int(viewpoint_camera.image_width),
@@ -63,7 +69,8 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
         sh_degree=pc.active_sh_degree,
         campos=viewpoint_camera.camera_center,
         prefiltered=False,
-        debug=pipe.debug
+        debug=pipe.debug,
+        **skip_maps
     )
 
     rasterizer = GaussianRasterizer(raster_settings=raster_settings)
@@ -119,6 +126,6 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
             "viewspace_points": screenspace_points,
             "visibility_filter" : radii > 0,
             "radii": radii,
-            'feature_map': feature_map,
-            'score_map': score_map,
+            'feature_map': feature_map if produce_feature else None,
+            'score_map': score_map if produce_score else None,
             "depth": depth} ###d
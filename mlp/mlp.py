@@ -1,9 +1,60 @@
 import torch
 from torch import nn
 from pathlib import Path
+from copy import deepcopy
+import torch.nn.functional as F
 from torchrl.modules import MLP
 
 
+def encode_dense(mlp, desc: torch.Tensor):
+    # run the per-pixel encoder MLP on a [B, C, H, W] map as 1x1 convs,
+    # so no channels-last permute/contiguous copy is needed
+    for layer in mlp.MLP:
+        if isinstance(layer, nn.Linear):
+            desc = F.conv2d(desc, layer.weight[:, :, None, None], layer.bias)
+        elif isinstance(layer, Int8Linear):
+            desc = layer(desc.movedim(1, -1)).movedim(-1, 1)
+        else:
+            desc = layer(desc)
+    return desc
+
+
+class Int8Linear(nn.Module):
+    # int8 weights with per-output-channel scales, activations quantized per call
+    def __init__(self, linear: nn.Linear):
+        super().__init__()
+        w = linear.weight.detach()
+        scale = w.abs().amax(dim=1).clamp(min=1e-8) / 127
+        self.register_buffer("weight", (w / scale[:, None]).round().to(torch.int8))
+        self.register_buffer("scale", scale)
+        self.register_buffer("bias", None if linear.bias is None else linear.bias.detach().clone())
+
+    def forward(self, x: torch.Tensor):
+        shape = x.shape
+        x = x.reshape(-1, shape[-1])
+        x_scale = x.abs().amax().clamp(min=1e-8) / 127
+        x_int8 = (x / x_scale).round().to(torch.int8)
+        n, k = self.weight.shape
+        if x.is_cuda and x.shape[0] > 16 and n % 8 == 0 and k % 8 == 0:
+            out = torch._int_mm(x_int8, self.weight.t()).float()
+        else:
+            out = x_int8.float() @ self.weight.float().t()
+        out = out * (x_scale * self.scale)
+        if self.bias is not None:
+            out = out + self.bias
+        return out.reshape(*shape[:-1], n)
+
+
+def quantize_mlp_int8(mlp):
+    # swap every nn.Linear of a loaded MLP module for its Int8Linear counterpart
+    mlp = deepcopy(mlp)
+    for seq in (mlp.MLP, mlp.MLP_de):
+        for i, layer in enumerate(seq):
+            if isinstance(layer, nn.Linear):
+                seq[i] = Int8Linear(layer)
+    return mlp
+
+
 
 class MLP_module_4_short(nn.Module):
     def __init__(self):
@@ -10,13 +10,20 @@
 #
 import os
 import json
-import random
+import shutil
+import torch
+import numpy as np
 from arguments import ModelParams
 import scene.dataset_readers as dataset_readers
 from utils.system_utils import searchForMaxIteration
 from scene.camera_utils import cameraList_from_camInfos, camera_to_JSON
 from encoders.superpoint.superpoint import SuperPoint
 from mlp.mlp import get_mlp_new
+try:
+    import orjson
+    ORJSON_FOUND = True
+except ImportError:
+    ORJSON_FOUND = False
 
 class Scene:
     def __init__(self, args:ModelParams, gaussians, load_iteration=None, 
@@ -53,9 +60,7 @@ class Scene:
             assert False, "Could not recognize scene type!"
 
         if not self.loaded_iter:
-            with open(scene_info.ply_path, 'rb') as src_file, \
-                open(os.path.join(self.model_path, "input.ply") , 'wb') as dest_file:
-                dest_file.write(src_file.read())
+            shutil.copyfile(scene_info.ply_path, os.path.join(self.model_path, "input.ply"))
             json_cams = []
             camlist = []
             if scene_info.test_cameras:
@@ -64,33 +69,49 @@ class Scene:
                 camlist.extend(scene_info.train_cameras)
             for id, cam in enumerate(camlist):
                 json_cams.append(camera_to_JSON(id, cam))
-            with open(os.path.join(self.model_path, "cameras.json"), 'w') as file:
-                json.dump(json_cams, file)
+            if ORJSON_FOUND:
+                with open(os.path.join(self.model_path, "cameras.json"), 'wb') as file:
+                    file.write(orjson.dumps(json_cams, option=orjson.OPT_SERIALIZE_NUMPY))
+            else:
+                with open(os.path.join(self.model_path, "cameras.json"), 'w') as file:
+                    json.dump(json_cams, file)
 
         if shuffle:
-            random.shuffle(scene_info.train_cameras)  # Multi-res consistent random shuffling
-            random.shuffle(scene_info.test_cameras)  # Multi-res consistent random shuffling
+            # Multi-res consistent random shuffling, seeded so reruns see the same order
+            rng = np.random.default_rng(args.seed)
+            for cams in (scene_info.train_cameras, scene_info.test_cameras):
+                cams[:] = [cams[i] for i in rng.permutation(len(cams))]
         self.cameras_extent = scene_info.nerf_normalization["radius"]
-        conf = {
-            "sparse_outputs": True,
-            "dense_outputs": True,
-            "max_num_keypoints": args.num_kpts,
-            "detection_threshold": float(args.detect_th),
-        }
-        encoder = SuperPoint(conf).cuda().eval()
-        mlp = get_mlp_new(dim=args.mlp_dim, name=args.mlp_name).cuda().eval()
+        if load_feature:
+            conf = {
+                "sparse_outputs": True,
+                "dense_outputs": True,
+                "max_num_keypoints": args.num_kpts,
+                "detection_threshold": float(args.detect_th),
+            }
+            encoder = SuperPoint(conf).cuda().eval().to(memory_format=torch.channels_last)
+            mlp = get_mlp_new(dim=args.mlp_dim, name=args.mlp_name).cuda().eval()
+            if getattr(args, "compile_encoder", False):
+                # only the encoder; features go through encode_dense, which never calls mlp.forward
+                encoder = torch.compile(encoder, dynamic=False)
+        else:
+            encoder = None
+            mlp = None
         self.encoder = encoder
         self.mlp = mlp
+        batch_size = getattr(args, "feature_batch_size", 1)
 
         for resolution_scale in resolution_scales:
             if load_train_cams:
                 print("Loading Training Cameras")
                 self.train_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.train_cameras, resolution_scale, args,
-                                                                                encoder=encoder, mlp=mlp, load_feature=load_feature)
+                                                                                encoder=encoder, mlp=mlp, load_feature=load_feature,
+                                                                                batch_size=batch_size)
             if load_test_cams:
                 print("Loading Test Cameras")
                 self.test_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.test_cameras, resolution_scale, args,
-                                                                               encoder=encoder, mlp=mlp, load_feature=load_feature)
+                                                                               encoder=encoder, mlp=mlp, load_feature=load_feature,
+                                                                               batch_size=batch_size)
 
         if self.loaded_iter:
             self.gaussians.load_ply(os.path.join(self.model_path,
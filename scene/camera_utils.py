@@ -9,8 +9,13 @@
 # For inquiries contact  george.drettakis@inria.fr
 #
 
+from collections import defaultdict
+import torch
 from scene.cameras import Camera
 import numpy as np
+from PIL import Image
+from utils.plot import plot_points
+from mlp.mlp import encode_dense
 from utils.general_utils import PILtoTorch
 from utils.graphics_utils import fov2focal
 
@@ -38,7 +43,16 @@ def loadCam(args, id, cam_info, resolution_scale, encoder, mlp, load_feature):
             global_down = orig_w / args.resolution
         scale = float(global_down) * float(resolution_scale)
         resolution = (int(orig_w / scale), int(orig_h / scale))
-    resized_image_rgb = PILtoTorch(cam_info.image, resolution)
+    image = cam_info.image
+    if getattr(image, "format", None) == "JPEG" and resolution[0] < orig_w:
+        # let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full size + resize;
+        # reopen so other resolution scales still see the full-size file
+        image = Image.open(cam_info.image.filename)
+        image.draft(image.mode, resolution)
+    resized_image_rgb = PILtoTorch(image, resolution)
+    if image is not cam_info.image:
+        # only the draft copy; cam_info.image is shared with later loads of this camera
+        image.close()
     gt_image = resized_image_rgb[:3, ...]
     loaded_mask = None
     if resized_image_rgb.shape[1] == 4:
@@ -64,11 +78,36 @@ def loadCam(args, id, cam_info, resolution_scale, encoder, mlp, load_feature):
                   load_feature=load_feature)
 
 
-def cameraList_from_camInfos(cam_infos, resolution_scale, args, encoder, mlp, load_feature=True):
+def extract_features(cameras, encoder, mlp, batch_size):
+    # cameras of the same resolution share one encoder forward
+    buckets = defaultdict(list)
+    for cam in cameras:
+        buckets[tuple(cam.original_image.shape)].append(cam)
+    with torch.no_grad():
+        for cams in buckets.values():
+            for start in range(0, len(cams), batch_size):
+                batch = cams[start:start + batch_size]
+                data = {}
+                data["image"] = torch.stack([cam.original_image for cam in batch]).cuda() \
+                                     .contiguous(memory_format=torch.channels_last)
+                pred = encoder(data)
+                desc = encode_dense(mlp, pred["dense_descriptors"])
+                for i, cam in enumerate(batch):
+                    _, H, W = cam.original_image.shape
+                    score = torch.zeros((1, H, W), dtype=torch.float32).cuda()
+                    plot_points(score, pred["keypoints"][i])
+                    cam.score_feature = score.cpu()
+                    cam.semantic_feature = desc[i].detach().cpu().clone()
+
+
+def cameraList_from_camInfos(cam_infos, resolution_scale, args, encoder, mlp, load_feature=True, batch_size=1):
     camera_list = []
+    batched = load_feature and batch_size > 1
     for id, cam_info in enumerate(cam_infos):
-        cam = loadCam(args, id, cam_info, resolution_scale, encoder, mlp, load_feature)
+        cam = loadCam(args, id, cam_info, resolution_scale, encoder, mlp, load_feature and not batched)
         camera_list.append(cam)
+    if batched:
+        extract_features(camera_list, encoder, mlp, batch_size)
     return camera_list
 
 
@@ -12,6 +12,7 @@ import torch
 import numpy as np
 from torch import nn
 from utils.plot import plot_points
+from mlp.mlp import encode_dense
 from utils.graphics_utils import getWorld2View2, getProjectionMatrix, getIntrinsicMatrix
 
 
@@ -61,11 +62,11 @@ class Camera(nn.Module):
         if load_feature:
             with torch.no_grad():
                 data = {}
-                data["image"] = self.original_image.unsqueeze(0).cuda()
+                data["image"] = self.original_image.unsqueeze(0).cuda().contiguous(memory_format=torch.channels_last)
                 pred = encoder(data)
                 kpts = pred["keypoints"][0]
                 desc = pred["dense_descriptors"][0]
-                x=mlp(desc.permute(1,2,0)).permute(2,0,1)
+                x=encode_dense(mlp, desc.unsqueeze(0))[0]
                 score = torch.zeros((1, H, W), dtype=torch.float32).cuda()
                 new_img = self.original_image.cuda()
                 plot_points(new_img, kpts)
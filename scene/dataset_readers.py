@@ -9,21 +9,28 @@
 # For inquiries contact  george.drettakis@inria.fr
 #
 import os
-import sys
 import json
 import torch
 import random
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from PIL import Image
+from tqdm import tqdm
 from pathlib import Path
 from typing import NamedTuple
 from utils.sh_utils import SH2RGB
 from plyfile import PlyData, PlyElement
 from scene.gaussian.gaussian_model import BasicPointCloud
-from utils.graphics_utils import getWorld2View2, focal2fov, fov2focal
-from scene.colmap_loader import read_extrinsics_text, read_intrinsics_text, qvec2rotmat, \
+from utils.graphics_utils import focal2fov, fov2focal
+from scene.colmap_loader import read_extrinsics_text, read_intrinsics_text, qvec2rotmat, qvecs2rotmats, \
                                 read_extrinsics_binary, read_intrinsics_binary, read_points3D_binary, \
                                 read_points3D_text, read_points3D_nvm
+try:
+    from numba import njit, prange
+    NUMBA_FOUND = True
+except ImportError:
+    NUMBA_FOUND = False
 
 class CameraInfo(NamedTuple):
     uid: int
@@ -51,88 +58,179 @@ class SceneInfo(NamedTuple):
 
 def getNerfppNorm(cam_info):
     def get_center_and_diag(cam_centers):
-        cam_centers = np.hstack(cam_centers)
         avg_cam_center = np.mean(cam_centers, axis=1, keepdims=True)
         center = avg_cam_center
         dist = np.linalg.norm(cam_centers - center, axis=0, keepdims=True)
         diagonal = np.max(dist)
         return center.flatten(), diagonal
-    cam_centers = []
-    for cam in cam_info:
-        W2C = getWorld2View2(cam.R, cam.T)
-        C2W = np.linalg.inv(W2C)
-        cam_centers.append(C2W[:3, 3:4])
+    # W2C = [R^T | T], so the camera centre (C2W translation) is -R @ T for all cameras at once
+    Rs = np.stack([cam.R for cam in cam_info])
+    Ts = np.stack([cam.T for cam in cam_info])
+    cam_centers = -np.einsum('nij,nj->in', Rs, Ts)
     center, diagonal = get_center_and_diag(cam_centers)
     radius = diagonal * 1.1
     translate = -center
     return {"translate": translate, "radius": radius}
 
 
+def load_feature_tensors(paths, load_feature=True, max_workers=8):
+    # prefetch per-image feature tensors concurrently, None where missing;
+    # one listdir per folder replaces a stat() per file
+    if not load_feature:
+        return [None] * len(paths)
+    present = {}
+    for folder in {os.path.dirname(path) for path in paths}:
+        present[folder] = set(os.listdir(folder)) if os.path.isdir(folder) else set()
+    def load(path):
+        # feature maps may be stored as fp16; hand fp32 to the rest of the pipeline
+        if os.path.basename(path) in present[os.path.dirname(path)]:
+            return torch.load(path, map_location='cpu', weights_only=True).float()
+        return None
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(load, paths))
+
+
+if NUMBA_FOUND:
+    @njit(parallel=True, cache=True)
+    def _composite_rgba(im, bg, out):
+        # one pass over the uint8 RGBA buffer, integer alpha blend straight to uint8
+        H, W = im.shape[0], im.shape[1]
+        for y in prange(H):
+            for x in range(W):
+                a = np.int32(im[y, x, 3])
+                for c in range(3):
+                    out[y, x, c] = (np.int32(im[y, x, c]) * a + bg[c] * (255 - a)) // 255
+
+
+def composite_rgba(im, bg):
+    # im: HxWx4 uint8, bg: 3 ints in 0..255
+    if NUMBA_FOUND:
+        out = np.empty(im.shape[:2] + (3,), dtype=np.uint8)
+        _composite_rgba(im, bg, out)
+        return out
+    # composite in 0..255 float32 space, reusing one buffer
+    im_data = im.astype(np.float32)
+    alpha = im_data[:, :, 3:4] * (1.0 / 255.0)
+    arr = np.multiply(im_data[:, :, :3], alpha)
+    np.add(arr, bg.astype(np.float32) * (1 - alpha), out=arr)
+    return arr.astype(np.uint8)
+
+
 def readColmapCameras(cam_extrinsics, cam_intrinsics, images_folder, semantic_feature_folder, load_feature):
     cam_infos = []
-    for idx, key in enumerate(cam_extrinsics):
-        sys.stdout.write('\r')
-        # the exact output you're looking for:
-        sys.stdout.write("Reading camera {}/{}".format(idx+1, len(cam_extrinsics)))
-        sys.stdout.flush()
-        extr = cam_extrinsics[key]
-        intr = cam_intrinsics[extr.camera_id]
+    extrs = [cam_extrinsics[key] for key in cam_extrinsics]
+    intrs = [cam_intrinsics[extr.camera_id] for extr in extrs]
+    for intr in intrs:
+        if intr.model not in ("SIMPLE_PINHOLE", "SIMPLE_RADIAL", "PINHOLE", "OPENCV"):
+            assert False, "Colmap camera model not handled: only undistorted datasets (PINHOLE or SIMPLE_PINHOLE cameras) supported!"
+    # rotations, translations and fovs for all cameras at once
+    Rs = np.transpose(qvecs2rotmats(np.stack([extr.qvec for extr in extrs])), (0, 2, 1))
+    Ts = np.stack([np.array(extr.tvec) for extr in extrs])
+    heights = np.array([intr.height for intr in intrs])
+    widths = np.array([intr.width for intr in intrs])
+    focals_x = np.array([intr.params[0] for intr in intrs])
+    focals_y = np.array([intr.params[1] if intr.model in ("PINHOLE", "OPENCV") else intr.params[0] for intr in intrs])
+    FovYs = 2 * np.arctan(heights / (2 * focals_y))
+    FovXs = 2 * np.arctan(widths / (2 * focals_x))
+    for idx, (extr, intr) in enumerate(tqdm(list(zip(extrs, intrs)), desc="Reading camera")):
         height = intr.height
         width = intr.width
         uid = intr.id
-        R = np.transpose(qvec2rotmat(extr.qvec))
-        T = np.array(extr.tvec)
-        if intr.model=="SIMPLE_PINHOLE" or intr.model=="SIMPLE_RADIAL":
-            focal_length_x = intr.params[0]
-            FovY = focal2fov(focal_length_x, height)
-            FovX = focal2fov(focal_length_x, width)
-        ### elif intr.model=="PINHOLE":
-        elif intr.model=="PINHOLE" or intr.model=="OPENCV":
-            focal_length_x = intr.params[0]
-            focal_length_y = intr.params[1]
-            FovY = focal2fov(focal_length_y, height)
-            FovX = focal2fov(focal_length_x, width)
-        else:
-            assert False, "Colmap camera model not handled: only undistorted datasets (PINHOLE or SIMPLE_PINHOLE cameras) supported!"
-        image_path = os.path.join(images_folder, os.path.basename(extr.name))
+        R = Rs[idx]
+        T = Ts[idx]
+        FovY = FovYs[idx]
+        FovX = FovXs[idx]
+        image_path = f"{images_folder}/{extr.name.rpartition('/')[2]}"
         if not os.path.exists(image_path):
-            image_path = os.path.join(images_folder, extr.name.replace('/', '-'))
-        image_name = os.path.basename(image_path).split(".")[0]
+            image_path = f"{images_folder}/{extr.name.replace('/', '-')}"
+        image_name = image_path.rpartition('/')[2].partition('.')[0]
         image = Image.open(image_path)
-        # feature_name = os.path.basename(semantic_feature_folder)
-        semantic_feature_path = os.path.join(semantic_feature_folder, image_name) + '_fmap.pt'
-        semantic_feature_name = os.path.basename(semantic_feature_path).split(".")[0]
-        if os.path.exists(semantic_feature_path) and load_feature:
-        # try:
-            semantic_feature = torch.load(semantic_feature_path) if os.path.exists(semantic_feature_path) else None
-        # except FileNotFoundError:
-        else:
-            semantic_feature = None
-        score_feature_path = os.path.join(semantic_feature_folder, image_name) + '_smap.pt'
-        score_feature_name = os.path.basename(score_feature_path).split(".")[0]
-        if os.path.exists(score_feature_path) and load_feature:
-            score_feature = torch.load(score_feature_path) if os.path.exists(score_feature_path) else None
-        else:
-            score_feature = None
-        cam_info = CameraInfo(uid=uid, R=R, T=T, FovY=FovY, FovX=FovX, image=image,
+        # image_name has no '.', so the feature names are plain suffixes
+        feature_prefix = f"{semantic_feature_folder}/{image_name}"
+        semantic_feature_path = feature_prefix + '_fmap.pt'
+        semantic_feature_name = image_name + '_fmap'
+        score_feature_path = feature_prefix + '_smap.pt'
+        score_feature_name = image_name + '_smap'
+        cam_infos.append(dict(uid=uid, R=R, T=T, FovY=FovY, FovX=FovX, image=image,
                             image_path=image_path, image_name=image_name,
                             intrinsic_params=intr.params,
                             intrinsic_model=intr.model,
                             width=width, height=height,
-                            semantic_feature=semantic_feature,           score_feature = score_feature,
                             semantic_feature_path=semantic_feature_path, score_feature_path = score_feature_path, 
-                            semantic_feature_name=semantic_feature_name, score_feature_name = score_feature_name)
-        cam_infos.append(cam_info)
-    sys.stdout.write('\n')
+                            semantic_feature_name=semantic_feature_name, score_feature_name = score_feature_name))
+    semantic_features = load_feature_tensors([c["semantic_feature_path"] for c in cam_infos], load_feature)
+    score_features = load_feature_tensors([c["score_feature_path"] for c in cam_infos], load_feature)
+    cam_infos = [CameraInfo(**c, semantic_feature=semantic_feature, score_feature=score_feature)
+                 for c, semantic_feature, score_feature in zip(cam_infos, semantic_features, score_features)]
     return cam_infos
 
 
+def file_key(path):
+    st = os.stat(path)
+    return path, st.st_mtime_ns, st.st_size
+
+
+def folder_key(folder):
+    # (path, mtime_ns, size) of every file, so in-place edits invalidate the cache too
+    return tuple(file_key(f"{folder}/{name}") for name in os.listdir(folder))
+
+
 def fetchPly(path):
-    plydata = PlyData.read(path)
-    vertices = plydata['vertex']
-    positions = np.vstack([vertices['x'], vertices['y'], vertices['z']]).T
-    colors = np.vstack([vertices['red'], vertices['green'], vertices['blue']]).T / 255.0
-    normals = np.vstack([vertices['nx'], vertices['ny'], vertices['nz']]).T
+    # Scenes are often reloaded in one process (train, eval, render); reparse only when the file changes.
+    # Callers get their own arrays, the cached ones are never handed out
+    pcd = _fetchPly(path, file_key(path))
+    return BasicPointCloud(points=pcd.points.copy(), colors=pcd.colors.copy(), normals=pcd.normals.copy())
+
+
+PLY_TYPES = {'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+             'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+             'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+             'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8'}
+
+
+def mmapPlyVertices(path):
+    # map the vertex block of a little-endian binary PLY whose first element is 'vertex' with scalar
+    # properties only; None for anything else (ascii, list properties, ...)
+    with open(path, 'rb') as f:
+        if f.readline().strip() != b'ply':
+            return None
+        fmt, count, fields, element = None, 0, [], None
+        while True:
+            line = f.readline()
+            if not line:
+                return None
+            words = line.split()
+            if not words:
+                continue
+            if words[0] == b'format':
+                fmt = words[1]
+            elif words[0] == b'element':
+                element = words[1]
+                if not fields and element == b'vertex':
+                    count = int(words[2])
+                elif not fields:
+                    return None
+            elif words[0] == b'property' and element == b'vertex':
+                if words[1] == b'list' or words[1].decode() not in PLY_TYPES:
+                    return None
+                fields.append((words[2].decode(), PLY_TYPES[words[1].decode()]))
+            elif words[0] == b'end_header':
+                offset = f.tell()
+                break
+    if fmt != b'binary_little_endian' or not fields or count == 0:
+        return None
+    dtype = np.dtype([(name, '<' + t) for name, t in fields])
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+
+
+@lru_cache(maxsize=8)
+def _fetchPly(path, key):
+    vertices = mmapPlyVertices(path)
+    if vertices is None:
+        vertices = PlyData.read(path)['vertex'].data
+    positions = np.column_stack((vertices['x'], vertices['y'], vertices['z']))
+    colors = np.column_stack((vertices['red'], vertices['green'], vertices['blue'])).astype(np.float32) * (1.0 / 255.0)
+    normals = np.column_stack((vertices['nx'], vertices['ny'], vertices['nz']))
     return BasicPointCloud(points=positions, colors=colors, normals=normals)
 
 
@@ -144,8 +242,12 @@ def storePly(path, xyz, rgb):
     normals = np.zeros_like(xyz)
 
     elements = np.empty(xyz.shape[0], dtype=dtype)
-    attributes = np.concatenate((xyz, normals, rgb), axis=1)
-    elements[:] = list(map(tuple, attributes))
+    for i, name in enumerate(('x', 'y', 'z')):
+        elements[name] = xyz[:, i]
+    for i, name in enumerate(('nx', 'ny', 'nz')):
+        elements[name] = normals[:, i]
+    for i, name in enumerate(('red', 'green', 'blue')):
+        elements[name] = rgb[:, i]
     # Create the PlyData object and write to file
     vertex_element = PlyElement.describe(elements, 'vertex')
     ply_data = PlyData([vertex_element])
@@ -153,26 +255,23 @@ def storePly(path, xyz, rgb):
 
 
 def readColmap_cams_params(intrinsic_folder, extrinsic_folder):
+    K, w2cs = _readColmap_cams_params(intrinsic_folder, extrinsic_folder,
+                                      folder_key(intrinsic_folder), folder_key(extrinsic_folder))
+    return K, w2cs.copy()
+
+
+@lru_cache(maxsize=8)
+def _readColmap_cams_params(intrinsic_folder, extrinsic_folder, intrinsic_key, extrinsic_key):
     intrinsic_files = os.listdir(intrinsic_folder)
     extrinsic_files = os.listdir(extrinsic_folder)
     # Read intrinsics
     with open(f"{intrinsic_folder}/{intrinsic_files[0]}", "r") as fid:
         K = float(fid.readline())
 
-    w2cs = []
     # Read extrincsics
-    for file in extrinsic_files:
-        with open(f"{extrinsic_folder}/{file}", "r") as fid:
-            c2w = []
-            while True:
-                line = fid.readline().rstrip()
-                if not line:
-                    break
-                c2w+=line.split(' ')
-        c2w = np.array([float(x) for x in c2w]).reshape((4,4))
-        w2c = np.linalg.inv(c2w)
-        # RTs
-        w2cs.append(w2c)
+    c2ws = np.stack([np.loadtxt(f"{extrinsic_folder}/{file}").reshape((4,4)) for file in extrinsic_files])
+    # RTs
+    w2cs = np.linalg.inv(c2ws)
     return K, w2cs
 
 
@@ -194,7 +293,7 @@ def readColmapSceneInfo(path: str, foundation_model: str, eval: bool, images=Non
                                            images_folder=os.path.join(path, image_dir), 
                                            semantic_feature_folder=os.path.join(path, semantic_feature_dir),
                                            load_feature = load_feature)
-    cam_infos = sorted(cam_infos_unsorted.copy(), key = lambda x : x.image_name)
+    cam_infos = sorted(cam_infos_unsorted, key = lambda x : x.image_name)
     if cam_infos[0].semantic_feature is not None:
         semantic_feature_dim = cam_infos[0].semantic_feature.shape[0]
     else:
@@ -223,50 +322,38 @@ def readColmapSceneInfo(path: str, foundation_model: str, eval: bool, images=Non
             intrinsic_files = os.listdir(test_intrinsic_folder)
             with open(f"{test_intrinsic_folder}/{intrinsic_files[0]}", "r") as fid:
                 K_test = float(fid.readline())
-            for i, view in enumerate(test_views):
-                sys.stdout.write('\r')
-                sys.stdout.write(f"Reading {i+1} test / {len(test_views)} camera")
-                sys.stdout.flush()
-                v_name = view.split('.')[0]
-                with open(f"{test_extrinsic_folder}/{v_name}.pose.txt", "r") as fid:
-                    c2w = []
-                    while True:
-                        line = fid.readline().rstrip()
-                        if not line:
-                            break
-                        c2w+=line.split(' ')
-                c2w = np.array([float(x) for x in c2w]).reshape((4,4))
-                w2c = np.linalg.inv(c2w)
-                w2c_sample = w2c
-                R = w2c_sample[:3,:3].T  # R is stored transposed due to 'glm' in CUDA code
-                T = w2c_sample[:3, 3]
-                focal_length_x = K_test
-                FovY = focal2fov(focal_length_x, height)
-                FovX = focal2fov(focal_length_x, width)
-                image_path = os.path.join(test_images_folder, view)
-                image_name = os.path.basename(image_path).split(".png")[0].split(".color")[0]
+            # all test views share one focal length and image size
+            focal_length_x = K_test
+            FovY = focal2fov(focal_length_x, height)
+            FovX = focal2fov(focal_length_x, width)
+            c2ws = np.stack([np.loadtxt(f"{test_extrinsic_folder}/{view.split('.')[0]}.pose.txt").reshape((4,4))
+                             for view in test_views])
+            w2cs = np.linalg.inv(c2ws)
+            Rs = np.transpose(w2cs[:, :3, :3], (0, 2, 1))  # R is stored transposed due to 'glm' in CUDA code
+            Ts = w2cs[:, :3, 3]
+            for i, view in enumerate(tqdm(test_views, desc="Reading test camera")):
+                R = Rs[i]
+                T = Ts[i]
+                image_path = f"{test_images_folder}/{view}"
+                image_name = view.split(".png")[0].split(".color")[0]
                 image = Image.open(image_path)
-                semantic_feature_path = os.path.join(test_feature_folder, image_name) + '_fmap.pt'
-                semantic_feature_name = os.path.basename(semantic_feature_path).split(".")[0]
-                if os.path.exists(semantic_feature_path) and load_feature:
-                    semantic_feature = torch.load(semantic_feature_path)
-                else:
-                    semantic_feature = None
-                score_feature_path = os.path.join(test_feature_folder, image_name) + '_smap.pt'
-                score_feature_name = os.path.basename(score_feature_path).split(".")[0]
-                if os.path.exists(score_feature_path) and load_feature:
-                    score_feature = torch.load(score_feature_path)
-                else:
-                    score_feature = None
-                cam_info = CameraInfo(uid=i, R=R, T=T, FovY=FovY, FovX=FovX, image=image,
+                feature_prefix = f"{test_feature_folder}/{image_name}"
+                semantic_feature_path = feature_prefix + '_fmap.pt'
+                semantic_feature_name = f"{image_name}_fmap".partition(".")[0]
+                score_feature_path = feature_prefix + '_smap.pt'
+                score_feature_name = f"{image_name}_smap".partition(".")[0]
+                test_cam_infos_unsorted.append(dict(uid=i, R=R, T=T, FovY=FovY, FovX=FovX, image=image,
                                     image_path=image_path, image_name=image_name,
                                     intrinsic_params=None,
                                     intrinsic_model=None,
                                     width=width, height=height,
-                                    semantic_feature=semantic_feature,           score_feature = score_feature,
                                     semantic_feature_path=semantic_feature_path, score_feature_path = score_feature_path, 
-                                    semantic_feature_name=semantic_feature_name, score_feature_name = score_feature_name)
-                test_cam_infos_unsorted.append(cam_info)
+                                    semantic_feature_name=semantic_feature_name, score_feature_name = score_feature_name))
+            semantic_features = load_feature_tensors([c["semantic_feature_path"] for c in test_cam_infos_unsorted], load_feature)
+            score_features = load_feature_tensors([c["score_feature_path"] for c in test_cam_infos_unsorted], load_feature)
+            test_cam_infos_unsorted = [CameraInfo(**c, semantic_feature=semantic_feature, score_feature=score_feature)
+                                       for c, semantic_feature, score_feature
+                                       in zip(test_cam_infos_unsorted, semantic_features, score_features)]
             test_cam_infos = sorted(test_cam_infos_unsorted, key = lambda x : x.image_name)
             # test_cam_infos = test_cam_infos_unsorted
         if view_num is not None:
@@ -305,6 +392,7 @@ def readCamerasFromTransforms(path, transformsfile, white_background, semantic_f
         contents = json.load(json_file)
         fovx = contents["camera_angle_x"]
         frames = contents["frames"]
+        bg = np.array([255, 255, 255] if white_background else [0, 0, 0], dtype=np.int32)
         for idx, frame in enumerate(frames):
             cam_name = os.path.join(path, frame["file_path"] + extension)
             c2w = np.array(frame["transform_matrix"])
@@ -315,43 +403,40 @@ def readCamerasFromTransforms(path, transformsfile, white_background, semantic_f
             image_path = os.path.join(path, cam_name)
             image_name = Path(cam_name).stem
             image = Image.open(image_path)
-            im_data = np.array(image.convert("RGBA"))
-            bg = np.array([1,1,1]) if white_background else np.array([0, 0, 0])
-            norm_data = im_data / 255.0
-            arr = norm_data[:,:,:3] * norm_data[:, :, 3:4] + bg * (1 - norm_data[:, :, 3:4])
-            image = Image.fromarray(np.array(arr*255.0, dtype=np.byte), "RGB")
+            image = Image.fromarray(composite_rgba(np.asarray(image.convert("RGBA")), bg), "RGB")
             fovy = focal2fov(fov2focal(fovx, image.size[0]), image.size[1])
             FovY = fovy 
             FovX = fovx
-            semantic_feature_path = os.path.join(semantic_feature_folder, image_name) + '_fmap_CxHxW.pt' 
-            semantic_feature_name = os.path.basename(semantic_feature_path).split(".")[0]
-            semantic_feature = torch.load(semantic_feature_path)
-            cam_infos.append(CameraInfo(uid=idx, R=R, T=T, FovY=FovY, FovX=FovX, image=image,
+            semantic_feature_path = f"{semantic_feature_folder}/{image_name}_fmap_CxHxW.pt"
+            semantic_feature_name = f"{image_name}_fmap_CxHxW".partition(".")[0]
+            cam_infos.append(dict(uid=idx, R=R, T=T, FovY=FovY, FovX=FovX, image=image,
                               image_path=image_path, image_name=image_name, width=image.size[0], height=image.size[1],
-                              semantic_feature=semantic_feature,
                               semantic_feature_path=semantic_feature_path,
                               semantic_feature_name=semantic_feature_name))
+    # every frame must have its feature map here, so missing files still raise
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        semantic_features = list(pool.map(lambda c: torch.load(c["semantic_feature_path"], map_location='cpu',
+                                                               weights_only=True).float(), cam_infos))
+    cam_infos = [CameraInfo(**c, semantic_feature=semantic_feature)
+                 for c, semantic_feature in zip(cam_infos, semantic_features)]
     return cam_infos
 
 
 
 def readSplit_cams_params(intrinsic_folder, extrinsic_folder):
+    K, w2cs = _readSplit_cams_params(intrinsic_folder, extrinsic_folder,
+                                     folder_key(intrinsic_folder), folder_key(extrinsic_folder))
+    return K, w2cs.copy()
+
+
+@lru_cache(maxsize=8)
+def _readSplit_cams_params(intrinsic_folder, extrinsic_folder, intrinsic_key, extrinsic_key):
     intrinsic_files = sorted(os.listdir(intrinsic_folder))
     extrinsic_files = sorted(os.listdir(extrinsic_folder))
     with open(f"{intrinsic_folder}/{intrinsic_files[0]}", "r") as fid:
         K = float(fid.readline())
-    w2cs = []
-    for file in extrinsic_files:
-        with open(f"{extrinsic_folder}/{file}", "r") as fid:
-            c2w = []
-            while True:
-                line = fid.readline().rstrip()
-                if not line:
-                    break
-                c2w+=line.split(' ')
-        c2w = np.array([float(x) for x in c2w]).reshape((4,4))
-        w2c = np.linalg.inv(c2w)
-        w2cs.append(w2c)
+    c2ws = np.stack([np.loadtxt(f"{extrinsic_folder}/{file}").reshape((4,4)) for file in extrinsic_files])
+    w2cs = np.linalg.inv(c2ws)
     return K, w2cs
 
 
@@ -403,18 +488,22 @@ def readSplitInfo(path, images, pcd = None, view_num=None, test_only_view_num=Fa
             w2cs_y.append(w2cs_test[i])
         test_views = y
         w2cs_test = w2cs_y
-    for i, view in enumerate(train_views):
-        sys.stdout.write('\r')
-        sys.stdout.write(f"Reading {i+1} train / {len(train_views)} camera")
-        sys.stdout.flush()
-        w2c_sample = w2cs_train[i]
-        R = w2c_sample[:3,:3].T  # R is stored transposed due to 'glm' in CUDA code
-        T = w2c_sample[:3, 3]
+    # R is stored transposed due to 'glm' in CUDA code
+    w2cs_train = np.stack(w2cs_train)
+    Rs_train, Ts_train = np.transpose(w2cs_train[:, :3, :3], (0, 2, 1)), w2cs_train[:, :3, 3]
+    Rs_test, Ts_test = [], []
+    # view_num subsampling can leave the test split empty
+    if len(w2cs_test):
+        w2cs_test = np.stack(w2cs_test)
+        Rs_test, Ts_test = np.transpose(w2cs_test[:, :3, :3], (0, 2, 1)), w2cs_test[:, :3, 3]
+    for i, view in enumerate(tqdm(train_views, desc="Reading train camera")):
+        R = Rs_train[i]
+        T = Ts_train[i]
         focal_length_x = K_train
         FovY = focal2fov(focal_length_x, height)
         FovX = focal2fov(focal_length_x, width)
-        image_path = os.path.join(train_images_folder, view)
-        image_name = os.path.basename(image_path).split(".png")[0].split(".color")[0]
+        image_path = f"{train_images_folder}/{view}"
+        image_name = view.split(".png")[0].split(".color")[0]
         image = Image.open(image_path)
         cam_info = CameraInfo(uid=i, R=R, T=T, 
                             FovY=FovY, FovX=FovX, focal_length=focal_length_x,
@@ -424,18 +513,14 @@ def readSplitInfo(path, images, pcd = None, view_num=None, test_only_view_num=Fa
                             intrinsic_model=None,
                             width=width, height=height,)
         train_cam_infos_unsorted.append(cam_info)
-    for i, view in enumerate(test_views):
-        sys.stdout.write('\r')
-        sys.stdout.write(f"Reading {i+1} test / {len(test_views)} camera")
-        sys.stdout.flush()
-        w2c_sample = w2cs_test[i]
-        R = w2c_sample[:3,:3].T  # R is stored transposed due to 'glm' in CUDA code
-        T = w2c_sample[:3, 3]
+    for i, view in enumerate(tqdm(test_views, desc="Reading test camera")):
+        R = Rs_test[i]
+        T = Ts_test[i]
         focal_length_x = K_test
         FovY = focal2fov(focal_length_x, height)
         FovX = focal2fov(focal_length_x, width)
-        image_path = os.path.join(test_images_folder, view)
-        image_name = os.path.basename(image_path).split(".png")[0].split(".color")[0]
+        image_path = f"{test_images_folder}/{view}"
+        image_name = view.split(".png")[0].split(".color")[0]
         image = Image.open(image_path)
         cam_info = CameraInfo(uid=i, R=R, T=T, 
                               FovY=FovY, FovX=FovX, focal_length=focal_length_x,
@@ -447,7 +532,7 @@ def readSplitInfo(path, images, pcd = None, view_num=None, test_only_view_num=Fa
         test_cam_infos_unsorted.append(cam_info)
     train_cam_infos = sorted(train_cam_infos_unsorted, key = lambda x : x.image_name)
     test_cam_infos = sorted(test_cam_infos_unsorted, key = lambda x : x.image_name)
-    print(f"\nTotal cams: {len(train_cam_infos)+len(test_cam_infos)}")
+    print(f"Total cams: {len(train_cam_infos)+len(test_cam_infos)}")
     nerf_normalization = getNerfppNorm(train_cam_infos)
     if 'Cambridge' in path:
         nvm_path = os.path.join(sfm_path, "reconstruction.nvm")
@@ -371,6 +371,9 @@ renderCUDA(
 	float C[CHANNELS] = { 0 };
 	float SF[NUM_SEMANTIC_CHANNELS] = { 0 };
 	float SCORE = { 0 };
+	// a null output skips that channel group (uniform per launch, no divergence)
+	const bool render_feature = out_feature_map != nullptr;
+	const bool render_score = out_score_map != nullptr;
 	// #################################################################
 	float D = { 0 };
 	// float D = 15.0f;  // Median Depth. TODO: This is a hack setting max_depth to 15
@@ -453,11 +456,13 @@ renderCUDA(
 			// }
 			// #################################################################
 			
-			for (int ch = 0; ch < NUM_SEMANTIC_CHANNELS; ch++){
-				SF[ch] += semantics[collected_id[j] * NUM_SEMANTIC_CHANNELS + ch] * alpha * T; 
-			}
+			if (render_feature)
+				for (int ch = 0; ch < NUM_SEMANTIC_CHANNELS; ch++){
+					SF[ch] += semantics[collected_id[j] * NUM_SEMANTIC_CHANNELS + ch] * alpha * T; 
+				}
 
-			SCORE += scores[collected_id[j]]*w;
+			if (render_score)
+				SCORE += scores[collected_id[j]]*w;
 
 			T = test_T;
 			// Keep track of last range entry to update this
@@ -478,11 +483,13 @@ renderCUDA(
 			out_color[ch * H * W + pix_id] = C[ch] + T * bg_color[ch];
 		// depth
 		out_depth[pix_id] = D;
-		out_score_map[pix_id] = SCORE;
+		if (render_score)
+			out_score_map[pix_id] = SCORE;
 		
 		// feature
-		for (int ch = 0; ch < NUM_SEMANTIC_CHANNELS; ch++)                 
-			out_feature_map[ch * H * W + pix_id] = SF[ch] + T * bg_color[ch];
+		if (render_feature)
+			for (int ch = 0; ch < NUM_SEMANTIC_CHANNELS; ch++)                 
+				out_feature_map[ch * H * W + pix_id] = SF[ch] + T * bg_color[ch];
 	}
 }
 
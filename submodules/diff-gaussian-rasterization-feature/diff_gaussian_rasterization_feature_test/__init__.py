@@ -94,6 +94,8 @@ class _RasterizeGaussians(torch.autograd.Function):
             raster_settings.campos,
             raster_settings.prefiltered,
             raster_settings.debug,
+            raster_settings.render_feature,
+            raster_settings.render_score,
         )
 
 
@@ -206,6 +208,9 @@ class GaussianRasterizationSettings(NamedTuple):
     campos : torch.Tensor
     prefiltered : bool
     debug : bool
+    # forward only: skipping a map leaves it empty, do not backprop through it
+    render_feature : bool = True
+    render_score : bool = True
 
 
 
@@ -60,7 +60,9 @@ RasterizeGaussiansCUDA(
 	const int degree,   // sh degree
 	const torch::Tensor& campos,
 	const bool prefiltered,
-	const bool debug)
+	const bool debug,
+	const bool render_feature,
+	const bool render_score)
 {
   if (means3D.ndimension() != 2 || means3D.size(1) != 3) {
     AT_ERROR("means3D must have dimensions (num_points, 3)");
@@ -78,8 +80,9 @@ RasterizeGaussiansCUDA(
   torch::Tensor radii = torch::full({P}, 0, means3D.options().dtype(torch::kInt32));
 
 
-  torch::Tensor out_feature_map = torch::full({NUM_SEMANTIC_CHANNELS, H, W}, 0.0, float_opts); /***/
-  torch::Tensor out_score_map = torch::full({1, H, W}, 0.0, float_opts); /***/
+  // skipped maps come back empty and are never written by the kernel
+  torch::Tensor out_feature_map = render_feature ? torch::full({NUM_SEMANTIC_CHANNELS, H, W}, 0.0, float_opts) : torch::empty({0}, float_opts); /***/
+  torch::Tensor out_score_map = render_score ? torch::full({1, H, W}, 0.0, float_opts) : torch::empty({0}, float_opts); /***/
   torch::Device device(torch::kCUDA);
   torch::TensorOptions options(torch::kByte);
   
@@ -126,8 +129,8 @@ RasterizeGaussiansCUDA(
 		tan_fovy,
 		prefiltered,
 		out_color.contiguous().data<float>(),
-		out_feature_map.contiguous().data<float>(), /***/
-		out_score_map.contiguous().data<float>(), /***/
+		render_feature ? out_feature_map.contiguous().data<float>() : nullptr, /***/
+		render_score ? out_score_map.contiguous().data<float>() : nullptr, /***/
 		out_depth.contiguous().data<float>(),
 		radii.contiguous().data<int>(),
 		debug
@@ -42,7 +42,9 @@ RasterizeGaussiansCUDA(
 	const int degree,
 	const torch::Tensor& campos,
 	const bool prefiltered,
-	const bool debug
+	const bool debug,
+	const bool render_feature,
+	const bool render_score
 	);
 
 
@@ -10,6 +10,33 @@ from utils.match.match_img import extract_kpt
 from utils.scoremap_vis import one_channel_vis
 from utils.graphics_utils import getWorld2View2, fov2focal
 from arguments import ModelParams, PipelineParams, get_combined_args
+try:
+    from numba import njit
+    NUMBA_FOUND = True
+except ImportError:
+    NUMBA_FOUND = False
+
+
+if NUMBA_FOUND:
+    @njit(cache=True, fastmath=True)
+    def _project_2d_to_3d(keypoints, depth, K, w2c):
+        # CPU twin of project_2d_to_3d, one pass over the keypoints
+        H, W = depth.shape
+        points_world = np.empty((keypoints.shape[0], 3), dtype=depth.dtype)
+        for n in range(keypoints.shape[0]):
+            u = min(max(keypoints[n, 0], 0), W - 1)
+            v = min(max(keypoints[n, 1], 0), H - 1)
+            d = depth[int(v), int(u)]
+            p0 = (u - K[0, 2]) / K[0, 0] * d - w2c[0, 3]
+            p1 = (v - K[1, 2]) / K[1, 1] * d - w2c[1, 3]
+            p2 = d - w2c[2, 3]
+            for j in range(3):
+                points_world[n, j] = w2c[0, j] * p0 + w2c[1, j] * p1 + w2c[2, j] * p2
+        return points_world
+
+    # compile on import, not on the first localized frame
+    _project_2d_to_3d(np.zeros((1, 2), np.float32), np.zeros((1, 1), np.float32),
+                      np.eye(3, dtype=np.float32), np.eye(4, dtype=np.float32))
 
 
 def project_2d_to_3d(keypoints, depth_map, K, w2c) -> torch.Tensor:
@@ -25,21 +52,25 @@ def project_2d_to_3d(keypoints, depth_map, K, w2c) -> torch.Tensor:
     Returns:
         torch.Tensor: 3D points in world coordinates of shape [N, 3].
     """
-    N = keypoints.shape[0]
     H, W = depth_map.shape[1], depth_map.shape[2]
+    keypoints = keypoints.to(depth_map)
+    K = K.to(depth_map)
+    if NUMBA_FOUND and not depth_map.is_cuda:
+        points_world = _project_2d_to_3d(keypoints.numpy(), depth_map[0].numpy(),
+                                         K.numpy(), w2c.to(depth_map).numpy())
+        return torch.from_numpy(points_world)
     u = keypoints[:, 0]  # x-coordinates
     v = keypoints[:, 1]  # y-coordinates
     u = u.clamp(0, W - 1)
     v = v.clamp(0, H - 1)
     depth = depth_map[0, v.long(), u.long()]  # Shape: [N]
-    uv1 = torch.stack([u, v, torch.ones_like(u)], dim=1).T  # Shape: [3, N]
-    K_inv = torch.inverse(K)  # Shape: [3, 3]
-    points_camera = (K_inv @ (uv1 * depth))  # Shape: [3, N]
-    points_camera_h = torch.cat([points_camera, torch.ones((1, N), 
-                                                device=points_camera.device)], dim=0)  # Shape: [4, N]
-    w2c_inv = torch.inverse(w2c)  # Shape: [4, 4]
-    points_world_h = (w2c_inv @ points_camera_h)  # Shape: [4, N]
-    points_world = points_world_h[:3].T  # Shape: [N, 3]
+    # zero-skew pinhole and rigid w2c: closed-form inverses, no linalg calls
+    x = (u - K[0, 2]) / K[0, 0] * depth
+    y = (v - K[1, 2]) / K[1, 1] * depth
+    points_camera = torch.stack([x, y, depth], dim=1)  # Shape: [N, 3]
+    R = w2c[:3, :3].to(points_camera)
+    t = w2c[:3, 3].to(points_camera)
+    points_world = (points_camera - t) @ R  # R^T (p - t), Shape: [N, 3]
     return points_world
 
 
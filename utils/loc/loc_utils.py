@@ -17,10 +17,49 @@ from matchers.mast3r.dust3r.dust3r.utils.image import convert_tensor_to_dust3r_f
 from matchers.mast3r.utils.functions import *
 from utils.match.match_img import semi_img_match
 from pathlib import Path
+from utils.graphics_utils import fov2focal
+from utils.loc.depth import project_2d_to_3d
+try:
+    from numba import njit
+    NUMBA_FOUND = True
+except ImportError:
+    NUMBA_FOUND = False
+
+
+if NUMBA_FOUND:
+    @njit(cache=True)
+    def _rotation_error(Ra, Rb):
+        # angle of Ra^T Rb in degrees, trace(Ra^T Rb) = sum(Ra * Rb)
+        tr = 0.0
+        for i in range(3):
+            for j in range(3):
+                tr += Ra[i, j] * Rb[i, j]
+        cos = min(max((tr - 1.0) / 2.0, -1.0), 1.0)
+        return np.arccos(cos) * 180 / np.pi
+
+    @njit(cache=True)
+    def _translation_error(ta, tb):
+        # distance in cm
+        err = 0.0
+        for i in range(3):
+            err += (ta[i] - tb[i]) ** 2
+        return np.sqrt(err) * 100
+
+    # compile on import, not on the first localized frame; callers always pass
+    # contiguous float64 so this is the only specialization
+    _rotation_error(np.eye(3), np.eye(3))
+    _translation_error(np.zeros(3), np.zeros(3))
+
+
+def _as_f64(*arrays):
+    return (np.ascontiguousarray(a, dtype=np.float64) for a in arrays)
 
 
 # log, calculate error
 def calculate_pose_errors(R_gt, t_gt, R_est, t_est):
+    if NUMBA_FOUND:
+        R_gt, t_gt, R_est, t_est = _as_f64(R_gt, t_gt, R_est, t_est)
+        return _rotation_error(R_est, R_gt), _translation_error(t_gt, t_est.reshape(3))
     rotError = np.matmul(R_est.T, R_gt)
     rotError = cv2.Rodrigues(rotError)[0]
     rotError = np.linalg.norm(rotError) * 180 / np.pi
@@ -29,6 +68,11 @@ def calculate_pose_errors(R_gt, t_gt, R_est, t_est):
 
 
 def calculate_pose_errors_ace(gt_pose_44, out_pose):
+    if NUMBA_FOUND:
+        gt_R, gt_t, out_R, out_t = _as_f64(gt_pose_44[0:3, 0:3], gt_pose_44[0:3, 3],
+                                           out_pose[0:3, 0:3], out_pose[0:3, 3])
+        # trace(out_R gt_R^T) == trace(out_R^T gt_R)
+        return _rotation_error(out_R, gt_R), _translation_error(gt_t, out_t)
     t_err = float(torch.norm(gt_pose_44[0:3, 3] - out_pose[0:3, 3]))*100
     gt_R = gt_pose_44[0:3, 0:3].numpy()
     out_R = out_pose[0:3, 0:3].numpy()
@@ -38,6 +82,31 @@ def calculate_pose_errors_ace(gt_pose_44, out_pose):
     return r_err, t_err
 
 
+def solve_pnp_p3p(world_points, image_points, K, iterations=1000):
+    # P3P minimal hypotheses, then one LM polish on the inliers instead of LM in every trial
+    success, rvec, tvec, inliers = cv2.solvePnPRansac(world_points, image_points, K, None,
+                                                      flags=cv2.SOLVEPNP_P3P, iterationsCount=iterations,
+                                                      reprojectionError=4.0)
+    if not success or inliers is None:
+        return None, None
+    inliers = inliers[:, 0]
+    rvec, tvec = cv2.solvePnPRefineLM(world_points[inliers], image_points[inliers], K, None, rvec, tvec)
+    R, _ = cv2.Rodrigues(rvec)
+    return R, tvec
+
+
+def get_intrinsics(view, cache):
+    # K as (float64 numpy for PnP, float32 cuda for unprojection), built once per camera model
+    key = (view.FoVx, view.image_width, view.image_height)
+    if key not in cache:
+        K = np.eye(3)
+        K[0, 0] = K[1, 1] = fov2focal(view.FoVx, view.image_width)
+        K[0, 2] = view.image_width / 2
+        K[1, 2] = view.image_height / 2
+        cache[key] = (K, torch.tensor(K, dtype=torch.float32, device="cuda"))
+    return cache[key]
+
+
 def log_errors(log_dir, rotation_errors, translation_errors, 
                         list_text,       error_text,        elapsed_time=None):
     total_frames = len(rotation_errors)
@@ -228,28 +297,9 @@ def img_match_mast3r(img0, img1, model, K, depth_map, w2c, gt_pose_44):
     initial_rvec, _ = cv2.Rodrigues(predict_c2w_ini[:3,:3].astype(np.float32))
     initial_tvec = predict_c2w_ini[:3,3].astype(np.float32)
     gt_c2w_pose = gt_pose_44.cpu().detach().numpy()
-    K_inv = np.linalg.inv(K)
-    depth_map = depth_map.squeeze(0).cpu().detach().numpy()
-    height, width = depth_map.shape
-    x_coords, y_coords = np.meshgrid(np.arange(width), np.arange(height))
-    x_flat = x_coords.flatten()
-    y_flat = y_coords.flatten()
-    depth_flat = depth_map.flatten()
-    x_normalized = (x_flat - K[0, 2]) / K[0, 0]
-    y_normalized = (y_flat - K[1, 2]) / K[1, 1]
-    X_camera = depth_flat * x_normalized
-    Y_camera = depth_flat * y_normalized
-    Z_camera = depth_flat
-    points_camera = np.vstack((X_camera, Y_camera, Z_camera, np.ones_like(X_camera)))
-    points_world = predict_c2w_ini @ points_camera
-    X_world = points_world[0, :]
-    Y_world = points_world[1, :]
-    Z_world = points_world[2, :]
-    points_3D = np.vstack((X_world, Y_world, Z_world))
-    scene_coordinates_gs = points_3D.reshape(3, original_size[0], original_size[1])
-    points_3D_at_pixels = np.zeros((matches_im0.shape[0], 3))
-    for i, (x, y) in enumerate(matches_im0):
-        points_3D_at_pixels[i] = scene_coordinates_gs[:, y, x]
+    # only the matched pixels are unprojected, on the GPU; just the [N, 3] points come back
+    points_3D_at_pixels = project_2d_to_3d(torch.from_numpy(matches_im0), depth_map, torch.from_numpy(K), w2c)\
+                                .to(torch.float64).cpu().numpy()
     
     print(f"time 4: {time.time()-s} s")
     if matches_im1.shape[0] >= 4:
@@ -314,13 +364,15 @@ def choose_th(feature, histogram_th):
     return percentile_value.item()
 
 
+# SuperPoint / LightGlue run in fp16 on channels-last images; keypoints stay fp32
 # 0 ours
+@torch.autocast("cuda", dtype=torch.float16)
 def img_match_ours(args, 
                    img0, 
                    scoremap1, featmap1, 
                    encoder,   matcher, mlp):
     tmp = {}
-    tmp["image"] = img0
+    tmp["image"] = img0.contiguous(memory_format=torch.channels_last)
     tmp_pred = encoder(tmp)
     #######################################
     desc = tmp_pred["descriptors"]
@@ -366,11 +418,12 @@ def img_match_ours(args,
 
 
 # 1 rival
+@torch.autocast("cuda", dtype=torch.float16)
 def img_match_rival(img0, img1, encoder, matcher) -> dict:
     d0 = {}
     d1 = {}
-    d0['image'] = img0
-    d1['image'] = img1
+    d0['image'] = img0.contiguous(memory_format=torch.channels_last)
+    d1['image'] = img1.contiguous(memory_format=torch.channels_last)
     p0 = encoder(d0)
     p1 = encoder(d1)
     ########################################################
@@ -400,14 +453,15 @@ def img_match_rival(img0, img1, encoder, matcher) -> dict:
 
 
 # 2 Renderkpt featSP
+@torch.autocast("cuda", dtype=torch.float16)
 def img_match_kptSPfeat(args, 
                        img0,     img1,
                        scoremap1,
                        encoder, matcher):
     d0 = {}
     d1 = {}
-    d0['image'] = img0
-    d1['image'] = img1
+    d0['image'] = img0.contiguous(memory_format=torch.channels_last)
+    d1['image'] = img1.contiguous(memory_format=torch.channels_last)
     p0 = encoder(d0)
     p1 = encoder(d1)
     #######################################
@@ -447,6 +501,7 @@ def img_match_kptSPfeat(args,
 
 
 # 3 nothappen ours
+@torch.autocast("cuda", dtype=torch.float16)
 def img_match_RenderRender(args,
                             scoremap0, featmap0,
                             scoremap1, featmap1,
@@ -481,9 +536,10 @@ def img_match_RenderRender(args,
     return result
 
 
+@torch.autocast("cuda", dtype=torch.float16)
 def img_match_circular(result01, img0, img1, img2, encoder, matcher) -> dict:
     d2 = {}
-    d2['image'] = img2
+    d2['image'] = img2.contiguous(memory_format=torch.channels_last)
     p2 = encoder(d2)
     ####################################### 02 match
     tmp = {}
@@ -4,70 +4,49 @@ import torch
 import argparse
 import numpy as np
 import torch.nn.functional as F
+from torch.utils.data import DataLoader
 from matchers.aliked import ALIKED
 from utils.utils import load_image2
 from encoders.DISK.disk_kornia import DISK
 from utils.scoremap_vis import one_channel_vis
 from encoders.superpoint.superpoint import SuperPoint
+from encoders.superpoint.utils import ImageFolder, AsyncSaver, shape_batches
 from mlp.mlp import get_mlp_model, get_mlp_dataset, get_mlp_augment,\
-                                    get_mlp_data_7scenes_Cambridege
+                                    get_mlp_data_7scenes_Cambridege, encode_dense
 
 
 def plot_points(img: torch.Tensor, kpts: torch.Tensor):
     C, H, W = img.shape
     x_cods = kpts[:, 0]
     y_cods = kpts[:, 1]
-    x_floor = torch.floor(x_cods).long()
-    y_floor = torch.floor(y_cods).long()
-    indices0 = [
-        (y_floor, x_floor),
-        (y_floor, x_floor + 1),
-        (y_floor + 1, x_floor),
-        (y_floor + 1, x_floor + 1)
-    ]
-    indices1 = [
-        (y_floor - 1, x_floor - 1),
-        (y_floor - 1, x_floor + 0),
-        (y_floor - 1, x_floor + 1),
-        (y_floor - 1, x_floor + 2),
+    x_floor = torch.floor(x_cods).long().to(img.device)
+    y_floor = torch.floor(y_cods).long().to(img.device)
+    # the 2x2 block around each keypoint, scattered in one indexing call
+    dy = torch.tensor([0, 0, 1, 1], device=img.device)
+    dx = torch.tensor([0, 1, 0, 1], device=img.device)
+    yi = (y_floor[None, :] + dy[:, None]).flatten()
+    xi = (x_floor[None, :] + dx[:, None]).flatten()
+    valid = (xi >= 0) & (xi < W) & (yi >= 0) & (yi < H)
+    yi, xi = yi[valid], xi[valid]
+    img[0, yi, xi] = 1.0
+    if C>1:
+        img[1:3, yi, xi] = 0.
 
-        (y_floor + 0 ,x_floor - 1),
-        (y_floor + 0, x_floor + 2),
-        (y_floor + 1 ,x_floor - 1),
-        (y_floor + 1, x_floor + 2),
-        
-        (y_floor + 2, x_floor - 1),
-        (y_floor + 2, x_floor + 0),
-        (y_floor + 2, x_floor + 1),
-        (y_floor + 2, x_floor + 2)
-    ]
-    for (yi, xi) in indices0:
-        valid = (xi >= 0) & (xi < W) & (yi >= 0) & (yi < H)
-        img[0, yi[valid], xi[valid]] = 1.0
-        if C>1:
-            img[1, yi[valid], xi[valid]] = 0.
-            img[2, yi[valid], xi[valid]] = 0.
-    # for (yi, xi) in indices1:
-    #     valid = (xi >= 0) & (xi < W) & (yi >= 0) & (yi < H)
-    #     img[0, yi[valid], xi[valid]] = 0.3
-    #     if C>1:
-    #         img[1, yi[valid], xi[valid]] = 0.
-    #         img[2, yi[valid], xi[valid]] = 0.
 
-
-def save_all(img:torch.Tensor, kpts:torch.Tensor, desc:torch.Tensor, sp_path:str, outimg_path:str, args):
+def save_all(img:torch.Tensor, kpts:torch.Tensor, desc:torch.Tensor, sp_path:str, outimg_path:str, args, saver=None):
     img = img[0]
     kpts = kpts[0]
     _ , H, W = img.shape
     score = torch.zeros((1, H, W), dtype=torch.float32)
     if args.mlp_method=="ALIKED" or args.mlp_method=="DISK":
-        desc = F.interpolate(desc.unsqueeze(0),  size=(int(desc.shape[1]/8), int(desc.shape[2]/8)), 
-                             mode='bilinear', align_corners=True).squeeze(0)
+        # integer 8x downsample: a strided mean instead of a bilinear grid
+        desc = F.avg_pool2d(desc.unsqueeze(0), kernel_size=8, stride=8).squeeze(0)
     plot_points(score, kpts)
     img = img.permute(1,2,0).cpu().numpy()
+    save = saver.save if saver is not None else lambda tensor, path: torch.save(tensor.cpu(), path)
     if args.use_feature:
-        torch.save(desc, f"{sp_path}_fmap.pt")
-    torch.save(score, f"{sp_path}_smap.pt")
+        save(desc.half(), f"{sp_path}_fmap.pt")
+    save(score, f"{sp_path}_smap.pt")
     score_vis = one_channel_vis(score)
     # score_vis.save(os.path.join(sp_path + "_smap_vis.png"))
     if outimg_path:
@@ -119,6 +98,11 @@ def main(args):
     elif args.mlp_method.startswith("augment"):
         mlp = get_mlp_augment(dim=args.mlp_dim, dataset=args.mlp_method)
     mlp = mlp.to("cuda").eval()
+    model = model.to(memory_format=torch.channels_last)
+    encode = encode_dense
+    if getattr(args, "compile", False):
+        # the 1x1-conv MLP stack becomes one graph per bucket shape
+        encode = torch.compile(encode_dense, mode="reduce-overhead", dynamic=False)
     img_folder = f"{args.source_path}/{args.images}"
     if args.output_images:
         ImgOut_folder = f"{args.source_path}/{args.output_images}"
@@ -128,24 +112,38 @@ def main(args):
     target_images = [os.path.join(img_folder, f) for f in target_images]
     os.makedirs(feature_folder, exist_ok=True)
 
-    for t in target_images:
-        print(f"Processing '{t}'...")
-        img_name = t.split(os.sep)[-1].split(".")[0]
-        #############################################################
-        # resize_num = int(args.resize_num)
-        resize_num = 1
-        #############################################################
-        img_tensor = load_image2(t, resize=resize_num).to("cuda").unsqueeze(0)
+    def extract_batch(names, images):
+        img_tensor = torch.stack(images).to("cuda", non_blocking=True)
+        img_tensor = img_tensor.contiguous(memory_format=torch.channels_last)
         data = {}
         data["image"] = img_tensor
         pred = model(data)
-        desc = pred["dense_descriptors"][0]
-        desc_mlp = mlp(desc.permute(1,2,0)).permute(2,0,1).contiguous().cpu()
-        kpts = pred["keypoints"].cpu()
-        sp_path = f"{feature_folder}/{img_name}"
-        if args.output_images:
-            outimg_path = f"{ImgOut_folder}/{img_name}"
-        save_all(img_tensor, kpts, desc_mlp, sp_path, outimg_path, args)
+        desc_mlp = encode(mlp, pred["dense_descriptors"])
+        # keypoints are a stacked tensor or a per-image list; both index per image
+        for i, img_name in enumerate(names):
+            kpts = pred["keypoints"][i].cpu().unsqueeze(0)
+            sp_path = f"{feature_folder}/{img_name}"
+            outimg_path = f"{ImgOut_folder}/{img_name}" if args.output_images else None
+            save_all(img_tensor[i:i+1], kpts, desc_mlp[i], sp_path, outimg_path, args, saver)
+
+    #############################################################
+    # resize_num = int(args.resize_num)
+    resize_num = 1
+    #############################################################
+    loader = DataLoader(ImageFolder(target_images, resize_num, loader=load_image2), batch_size=None, shuffle=False,
+                        num_workers=getattr(args, "num_workers", 4), pin_memory=True)
+    saver = AsyncSaver(max_workers=4)
+    batch_size = getattr(args, "batch_size", 8)
+    if args.mlp_method != "ALIKED":
+        # DISK and SuperPoint keypoint counts differ per image, so keep one image per batch
+        batch_size = 1
+    torch.backends.cudnn.benchmark = True
+    try:
+        with torch.inference_mode(), torch.autocast("cuda", dtype=torch.float16):
+            for names, images in shape_batches(loader, batch_size):
+                extract_batch(names, images)
+    finally:
+        saver.close()
 
 
 if __name__=="__main__":
@@ -160,6 +158,9 @@ if __name__=="__main__":
     parser.add_argument("--max_num_keypoints", type=float, default=512,)
     parser.add_argument("--output_images", type=str, default=None)
     parser.add_argument("--images", type=str, default="rgb")
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--num_workers", type=int, default=4)
+    parser.add_argument("--compile", action="store_true")
     args = parser.parse_args()
     feat_name = "twoPhase"
     args.feature_name = f"{feat_name}"
@@ -12,6 +12,7 @@
 from errno import EEXIST
 from os import makedirs, path
 import os
+import re
 
 def mkdir_p(folder_path):
     # Creates a directory. equivalent to using mkdir -p on the command line
@@ -23,6 +24,9 @@ def mkdir_p(folder_path):
         else:
             raise
 
+ITERATION_DIR = re.compile(r"iteration_(\d+)")
+
 def searchForMaxIteration(folder):
-    saved_iters = [int(fname.split("_")[-1]) for fname in os.listdir(folder)]
+    with os.scandir(folder) as entries:
+        saved_iters = [int(m.group(1)) for e in entries if (m := ITERATION_DIR.fullmatch(e.name))]
     return max(saved_iters)
@@ -0,0 +1,65 @@
+import cv2
+import torch
+import numpy as np
+import utils.loc.loc_utils as loc_utils
+from utils.loc.depth import project_2d_to_3d
+from utils.loc.ace_utils import ace_pose_stream, frame_timer
+from utils.loc.pycolmap_utils import opencv_to_pycolmap_pnp
+
+
+def ace_frames(views, ace_network, ace_test_loader):
+    """
+    Frame loop shared by the ACE localizers.
+
+    Yields:
+        (index, view, gt_pose_44, dsac_future, start) for every test frame in order, start
+        being the frame timer. DSAC* of the next batch is already running on worker threads
+        while the caller renders / matches this frame.
+    """
+    for first, gt_pose_B44, dsac_futures in ace_pose_stream(ace_network, ace_test_loader):
+        for index, (gt_pose_44, dsac_future) in enumerate(zip(gt_pose_B44, dsac_futures), start=first):
+            start = frame_timer()
+            yield index, views[index], gt_pose_44, dsac_future, start
+
+
+def apply_prior(view, out_pose, w2c):
+    # rigid inverse of the c2w pose on the GPU, only t_inv comes back for the camera
+    out_pose_gpu = out_pose.cuda(non_blocking=True)
+    R = out_pose_gpu[:3, :3]
+    w2c[:3, :3] = R.T
+    w2c[:3, 3] = -R.T @ out_pose_gpu[:3, 3]
+    # the camera keeps R, and the DSAC* pose buffer is reused two batches later
+    out_R = out_pose[0:3, 0:3].numpy().copy()
+    t_inv = w2c[:3, 3].cpu().numpy()
+    view.update_RT(out_R, t_inv)
+
+
+def unproject_matches(result, depth, K_gpu, w2c):
+    # unproject on the GPU, only the [N, 3] points go back to the host
+    world_points = project_2d_to_3d(result['mkpt1'], depth, K_gpu, w2c).to(torch.float64).cpu().numpy()
+    image_points = result['mkpt0'].to(torch.float64).cpu().numpy()
+    return world_points, image_points
+
+
+def solve_pnp(pnp, world_points, image_points, K, view, ransac_iters):
+    # w2c (R, t) of the query from 2D-3D matches
+    if pnp == "iters":
+        # MAGSAC++ with local optimisation stops early once the confidence is reached
+        _, R_final, t_final, _ = cv2.solvePnPRansac(world_points, image_points, K, distCoeffs=None,
+                                                    flags=cv2.USAC_MAGSAC, confidence=0.9999,
+                                                    reprojectionError=4.0, iterationsCount=ransac_iters)
+        R_final, _ = cv2.Rodrigues(R_final)
+    elif pnp == "p3p":
+        R_final, t_final = loc_utils.solve_pnp_p3p(world_points, image_points, K, ransac_iters)
+        if R_final is None:
+            # no consensus: keep the pose the view was rendered from (the prior) for this query
+            R_final = view.R.T.copy()
+            t_final = np.asarray(view.T, dtype=np.float64).reshape(3, 1)
+    elif pnp == "epnp":
+        _, R_final, t_final, _ = cv2.solvePnPRansac(world_points, image_points, K, distCoeffs=None,
+                                                    flags=cv2.SOLVEPNP_EPNP)
+        R_final, _ = cv2.Rodrigues(R_final)
+    elif pnp == "pycolmap":
+        R_final, t_final = opencv_to_pycolmap_pnp(world_points, image_points, K,
+                                                  view.image_width, view.image_height)
+    return R_final, t_final
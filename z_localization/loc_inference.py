@@ -12,7 +12,23 @@ from gaussian_renderer.__init__loc import render
 from matchers.lightglue import LightGlue
 from encoders.superpoint.superpoint import SuperPoint
 from arguments import ModelParams, PipelineParams, get_combined_args
-from mlp.mlp import get_mlp_model, get_mlp_dataset, get_mlp_augment
+from mlp.mlp import get_mlp_model, get_mlp_dataset, get_mlp_augment, get_mlp_data_7scenes_Cambridege
+
+
+# first matching prefix wins; an mlp_method matching none of them raises in get_mlp
+MLP_FACTORIES = [
+    ("SP", lambda dim, method: get_mlp_model(dim=dim, type=method)),
+    ("dataset", lambda dim, method: get_mlp_data_7scenes_Cambridege(dim=dim, dataset=method)),
+    ("augment", lambda dim, method: get_mlp_augment(dim=dim, dataset=method)),
+    (("pgt", "pairs", "match", "Cambridge"), lambda dim, method: get_mlp_dataset(dim=dim, dataset=method)),
+]
+
+
+def get_mlp(dim, method):
+    factory = next((f for prefix, f in MLP_FACTORIES if method.startswith(prefix)), None)
+    if factory is None:
+        raise ValueError(f"Unknown mlp_method: {method}")
+    return factory(dim, method)
 
 
 def choose_th(score, histogram_th):
@@ -37,16 +53,7 @@ def localize_set(model_path, name, views, gaussians, pipe_param, background, arg
     prior_rErr = []
     prior_tErr = []
     scene_name = model_path.split('/')[-3]
-    if args.mlp_method.startswith("SP"):
-        mlp = get_mlp_model(dim = args.mlp_dim, type=args.mlp_method)
-    elif args.mlp_method.startswith("pgt") or args.mlp_method.startswith("pairs") or args.mlp_method.startswith("match"):
-        mlp = get_mlp_dataset(dim=args.mlp_dim, dataset=args.mlp_method)
-    elif args.mlp_method == "Cambridge":
-        mlp = get_mlp_dataset(dim=args.mlp_dim, dataset=args.mlp_method)
-    elif args.mlp_method.startswith("Cambridge"):
-        mlp = get_mlp_dataset(dim=args.mlp_dim, dataset=args.mlp_method)
-    elif args.mlp_method.startswith("augment"):
-        mlp = get_mlp_augment(dim=args.mlp_dim, dataset=args.mlp_method)
+    mlp = get_mlp(args.mlp_dim, args.mlp_method)
     mlp = mlp.to("cuda").eval()
     print(scene_name)
 
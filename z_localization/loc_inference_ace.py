@@ -1,26 +1,22 @@
 import os
-import cv2
-import time
 import copy
 import torch
 import random
-import dsacstar
 import numpy as np
 from pathlib import Path
+from functools import lru_cache
 from data.ace.dataset import CamLocDataset
 from data.ace.ace_network import Regressor
 from argparse import ArgumentParser
 import utils.loc.loc_utils as loc_utils
-from torch.cuda.amp import autocast
 from scene import Scene
 from scene.gaussian.gaussian_model import GaussianModel
 from torch.utils.data import DataLoader
-from utils.graphics_utils import fov2focal
-from utils.loc.depth import project_2d_to_3d
+from utils.loc.ace_utils import load_ace_state_dicts, elapsed_since
+from z_localization._localize_core import ace_frames, apply_prior, unproject_matches, solve_pnp
 from gaussian_renderer.__init__loc import render
 from matchers.lightglue import LightGlue
 from encoders.superpoint.superpoint import SuperPoint
-from utils.loc.pycolmap_utils import opencv_to_pycolmap_pnp
 from arguments import ModelParams, PipelineParams, get_combined_args
 from mlp.mlp import get_mlp_new
 from datetime import datetime
@@ -64,6 +60,17 @@ def refine_img(img_gt0, img_gt_render0, img_render1):
     return fused_01
 
 
+@lru_cache(maxsize=None)
+def load_mlp(dim, name, compile=False):
+    # repeated localize_set calls in a sweep reuse the loaded weights
+    mlp = get_mlp_new(dim=dim, name=name).cuda().eval()
+    if compile:
+        # the keypoint count changes every frame, so only the feature dim is static
+        mlp.forward = torch.compile(mlp.forward, dynamic=True)
+        mlp.decode = torch.compile(mlp.decode, dynamic=True)
+    return mlp.requires_grad_(False)
+
+
 random.seed(100)
 def localize_set(args, 
                  error_foler_path, all_err_log_path,
@@ -81,222 +88,182 @@ def localize_set(args,
     fourth_rErr = []
     fourth_tErr = []
     total_elapsed_time = 0
-    mlp = get_mlp_new(dim=args.mlp_dim, name=args.method).cuda().eval()
-    with torch.no_grad():
-        for index, (image_B1HW, _, gt_pose_B44, _, intrinsics_B33, _, _, filenames) in enumerate(ace_test_loader):
-            start = time.time()
-            image_B1HW = image_B1HW.to(torch.device("cuda"), non_blocking=True)
-            with autocast(enabled=True):
-                scene_coordinates_B3HW = ace_network(image_B1HW)
-            scene_coordinates_B3HW = scene_coordinates_B3HW.float().cpu()
+    mlp = load_mlp(args.mlp_dim, args.method, args.compile)
+    # intrinsics per camera model and the refined poses are reused across frames
+    K_cache = {}
+    w2c = torch.eye(4, 4, device='cuda')
+    w2c_2 = torch.eye(4, 4, device='cuda')
+    # ours / nothappen_ours match on the feature map, Renderkpt_featSP only on the scores
+    maps = {"produce_feature": args.match_type in (0, 3), "produce_score": args.match_type in (0, 2, 3)}
+    no_maps = {"produce_feature": False, "produce_score": False}
+    with torch.inference_mode():
+        # DSAC* of the next batch runs on worker threads while this one renders and matches
+        for index, view, gt_pose_44, dsac_future, start in ace_frames(views, ace_network, ace_test_loader):
             ########################################################
-            for _, (scene_coordinates_3HW, gt_pose_44, intrinsics_33, frame_path) in \
-                            enumerate(zip(scene_coordinates_B3HW, gt_pose_B44, intrinsics_B33, filenames)):
-                ########################################################
-                focal_length = intrinsics_33[0, 0].item()
-                ppX = intrinsics_33[0, 2].item()
-                ppY = intrinsics_33[1, 2].item()
-                assert torch.allclose(intrinsics_33[0, 0], intrinsics_33[1, 1])
-                out_pose = torch.zeros((4, 4))
-                inlier_count = dsacstar.forward_rgb(
-                    scene_coordinates_3HW.unsqueeze(0), out_pose, 64, 10,
-                    focal_length, ppX, ppY, 100, 100, ace_network.OUTPUT_SUBSAMPLE,)
-                rotError, transError = loc_utils.calculate_pose_errors_ace(
-                    gt_pose_44, out_pose)
-                ########################################################
-                view = views[index]
-                print(f"{index}, {view.image_name}")
-                
-                K = np.eye(3)
-                focal_length = fov2focal(view.FoVx, view.image_width)
-                K[0, 0] = K[1, 1] = focal_length
-                K[0, 2] = view.image_width / 2
-                K[1, 2] = view.image_height / 2
-                gt_R = view.R
-                gt_t = view.T
-                gt_extrinsic_matrix = view.extrinsic_matrix
-                ########################################################
-                if args.match_type==3 or args.match_type==4 or (args.save_render_img is not None):
-                    render_pkg0 = render(view, gaussians, pipe_param, background)
-                ########################################################
-                out_R = out_pose[0:3, 0:3].numpy()
-                out_t = out_pose[0:3, 3].numpy()
-                R_inv = out_R.T
-                t_inv = -R_inv @ out_t
-                w2c = torch.eye(4, 4, device='cuda')
-                w2c[:3, :3] = torch.from_numpy(R_inv).float()
-                w2c[:3, 3] = torch.from_numpy(t_inv).float()
-                view.update_RT(out_R, t_inv)
-                render_pkg1 = render(view, gaussians, pipe_param, background)
-                ########################################################
-                gt_img0 = view.original_image[0:3, :, :].cuda().unsqueeze(0)
-                # 0 ours
-                if args.match_type==0:
-                    result = loc_utils.img_match_ours(args, gt_img0, 
-                                                      render_pkg1["score_map"], render_pkg1["feature_map"], 
-                                                      encoder, matcher, mlp)
-                # 1 rival
-                elif args.match_type==1 or args.match_type==6 or args.match_type==7 or args.match_type==8:
-                    result = loc_utils.img_match_rival(gt_img0, render_pkg1["render"].unsqueeze(0), 
-                                                       encoder, matcher)
-                # 2 Renderkpt featSP
-                elif args.match_type==2:
-                    result = loc_utils.img_match_kptSPfeat(args, gt_img0, render_pkg1["render"].unsqueeze(0), 
-                                                           render_pkg1["score_map"],
-                                                           encoder, matcher)
-                # 3 nothappen ours
-                elif args.match_type==3:
-                    result = loc_utils.img_match_RenderRender(args, render_pkg0["score_map"], render_pkg0["feature_map"],
-                                                              render_pkg1["score_map"], render_pkg1["feature_map"],
-                                                              matcher, mlp, )
-                # 4 nothappen rival
-                elif args.match_type==4:
-                    result = loc_utils.img_match_rival(render_pkg0["render"].unsqueeze(0), 
-                                                       render_pkg1["render"].unsqueeze(0), 
-                                                       encoder, matcher)
-                # 5 rival image blur
-                elif args.match_type==5:
-                    new_gtimg0 = refine_img(gt_img0.squeeze(0), render_pkg0["render"], render_pkg1["render"])
-                    result = loc_utils.img_match_rival(new_gtimg0, render_pkg1["render"].unsqueeze(0), 
+            K, K_gpu = loc_utils.get_intrinsics(view, K_cache)
+            gt_R = view.R
+            gt_t = view.T
+            gt_extrinsic_matrix = view.extrinsic_matrix
+            ########################################################
+            if args.match_type==3 or args.match_type==4 or (args.save_render_img is not None):
+                render_pkg0 = render(view, gaussians, pipe_param, background, **maps)
+            ########################################################
+            out_pose = dsac_future.result()
+            rotError, transError = loc_utils.calculate_pose_errors_ace(
+                gt_pose_44, out_pose)
+            ########################################################
+            apply_prior(view, out_pose, w2c)
+            render_pkg1 = render(view, gaussians, pipe_param, background, **maps)
+            ########################################################
+            gt_img0 = view.original_image[0:3, :, :].cuda(non_blocking=True).unsqueeze(0)
+            # 0 ours
+            if args.match_type==0:
+                result = loc_utils.img_match_ours(args, gt_img0, 
+                                                  render_pkg1["score_map"], render_pkg1["feature_map"], 
+                                                  encoder, matcher, mlp)
+            # 1 rival
+            elif args.match_type==1 or args.match_type==6 or args.match_type==7 or args.match_type==8:
+                result = loc_utils.img_match_rival(gt_img0, render_pkg1["render"].unsqueeze(0), 
+                                                   encoder, matcher)
+            # 2 Renderkpt featSP
+            elif args.match_type==2:
+                result = loc_utils.img_match_kptSPfeat(args, gt_img0, render_pkg1["render"].unsqueeze(0), 
+                                                       render_pkg1["score_map"],
                                                        encoder, matcher)
-                ########################################################
-                if result is None:
-                    prior_rErr.append(rotError)
-                    prior_tErr.append(transError)
-                    rErrs.append(rotError)
-                    tErrs.append(transError)
+            # 3 nothappen ours
+            elif args.match_type==3:
+                result = loc_utils.img_match_RenderRender(args, render_pkg0["score_map"], render_pkg0["feature_map"],
+                                                          render_pkg1["score_map"], render_pkg1["feature_map"],
+                                                          matcher, mlp, )
+            # 4 nothappen rival
+            elif args.match_type==4:
+                result = loc_utils.img_match_rival(render_pkg0["render"].unsqueeze(0), 
+                                                   render_pkg1["render"].unsqueeze(0), 
+                                                   encoder, matcher)
+            # 5 rival image blur
+            elif args.match_type==5:
+                new_gtimg0 = refine_img(gt_img0.squeeze(0), render_pkg0["render"], render_pkg1["render"])
+                result = loc_utils.img_match_rival(new_gtimg0, render_pkg1["render"].unsqueeze(0), 
+                                                   encoder, matcher)
+            ########################################################
+            if result is None:
+                prior_rErr.append(rotError)
+                prior_tErr.append(transError)
+                rErrs.append(rotError)
+                tErrs.append(transError)
+                if args.verbose:
                     print(f"Rotation Error: {rotError} deg")
                     print(f"Translation Error: {transError} cm")
-                    total_elapsed_time += time.time()-start
-                    continue
-                if not len(result['mkpt1'].cpu())>args.stop_kpt_num:
-                    prior_rErr.append(rotError)
-                    prior_tErr.append(transError)
-                    rErrs.append(rotError)
-                    tErrs.append(transError)
+                total_elapsed_time += elapsed_since(start)
+                continue
+            if not result['mkpt1'].shape[0]>args.stop_kpt_num:
+                prior_rErr.append(rotError)
+                prior_tErr.append(transError)
+                rErrs.append(rotError)
+                tErrs.append(transError)
+                if args.verbose:
                     print(f"Rotation Error: {rotError} deg")
                     print(f"Translation Error: {transError} cm")
-                    total_elapsed_time += time.time()-start
-                    continue
-                ########################################################
-                world_points = project_2d_to_3d(result['mkpt1'].cpu(), render_pkg1["depth"].cpu(), 
-                                            torch.tensor(K, dtype=torch.float32).cpu(), w2c.cpu())\
-                                            .cpu().numpy().astype(np.float64)
-                match0 = result['mkpt0'].cpu().numpy().astype(np.float64)
-                if args.pnp == "iters":
-                    _, R_final, t_final, _ = cv2.solvePnPRansac(world_points, match0, K, distCoeffs=None, 
-                                                                flags=cv2.SOLVEPNP_ITERATIVE, 
-                                                                iterationsCount=args.ransac_iters)
-                    R_final, _ = cv2.Rodrigues(R_final)
-                elif args.pnp == "epnp":
-                    _, R_final, t_final, _ = cv2.solvePnPRansac(world_points, match0, K, distCoeffs=None, 
-                                                                flags=cv2.SOLVEPNP_EPNP)
-                    R_final, _ = cv2.Rodrigues(R_final)
-                elif args.pnp == "pycolmap":
-                    R_final, t_final = opencv_to_pycolmap_pnp(world_points, match0, K, 
-                                                        view.image_width, view.image_height)
-                ########################################################
-                rotError_two, transError_two = loc_utils.calculate_pose_errors(gt_R, gt_t, R_final.T, t_final)
-                rotError_final, transError_final = rotError_two, transError_two
+                total_elapsed_time += elapsed_since(start)
+                continue
+            ########################################################
+            world_points, match0 = unproject_matches(result, render_pkg1["depth"], K_gpu, w2c)
+            R_final, t_final = solve_pnp(args.pnp, world_points, match0, K, view, args.ransac_iters)
+            ########################################################
+            rotError_two, transError_two = loc_utils.calculate_pose_errors(gt_R, gt_t, R_final.T, t_final)
+            rotError_final, transError_final = rotError_two, transError_two
+            ########################################################
+            if args.match_type==6 or args.match_type==7 or args.match_type==8:
+                update_R = R_final.T
+                update_t = t_final.squeeze(-1)
+                view.update_RT(update_R, update_t)
+                render_pkg1 = render(view, gaussians, pipe_param, background, **maps)
+                # gt_img0, render_pkg1["render"], render_pkg2["render"]
+                if args.match_type==6:
+                    match_012_final = loc_utils.img_match_circular(
+                        result, gt_img0, render_pkg1["render"].unsqueeze(0), render_pkg1["render"].unsqueeze(0), 
+                        encoder, matcher)
+                if args.match_type==7 or args.match_type==8:
+                    match_012_final = loc_utils.img_match_rival(gt_img0, render_pkg1["render"].unsqueeze(0), 
+                                                   encoder, matcher)
+                result = match_012_final
+                ###################
+                w2c_2[:3, :3].copy_(torch.from_numpy(update_R.T))
+                w2c_2[:3, 3].copy_(torch.from_numpy(update_t))
+                ###################
+                world_points, match0 = unproject_matches(result, render_pkg1["depth"], K_gpu, w2c_2)
+                R_third, t_third = solve_pnp("pycolmap", world_points, match0, K, view, args.ransac_iters)
+                rotError_third, transError_third = loc_utils.calculate_pose_errors(gt_R, gt_t, R_third.T, t_third)
+                rotError_final, transError_final = rotError_third, transError_third
                 ########################################################
-                if args.match_type==6 or args.match_type==7 or args.match_type==8:
-                    update_R = R_final.T
-                    update_t = t_final.squeeze(-1)
+                if args.match_type==8:
+                    update_R = R_third.T
+                    update_t = t_third.squeeze(-1)
                     view.update_RT(update_R, update_t)
-                    render_pkg1 = render(view, gaussians, pipe_param, background)
-                    # gt_img0, render_pkg1["render"], render_pkg2["render"]
-                    if args.match_type==6:
-                        match_012_final = loc_utils.img_match_circular(
-                            result, gt_img0, render_pkg1["render"].unsqueeze(0), render_pkg1["render"].unsqueeze(0), 
-                            encoder, matcher)
-                    if args.match_type==7 or args.match_type==8:
-                        match_012_final = loc_utils.img_match_rival(gt_img0, render_pkg1["render"].unsqueeze(0), 
-                                                       encoder, matcher)
+                    render_pkg1 = render(view, gaussians, pipe_param, background, **maps)
+                    match_012_final = loc_utils.img_match_rival(gt_img0, render_pkg1["render"].unsqueeze(0), 
+                                                   encoder, matcher)
                     result = match_012_final
                     ###################
-                    w2c_2 = torch.eye(4, 4, device='cuda')
-                    w2c_2[:3, :3] = torch.from_numpy(update_R.T).float()
-                    w2c_2[:3, 3] = torch.from_numpy(update_t).float()
-                    ###################
-                    world_points = project_2d_to_3d(result['mkpt1'].cpu(), render_pkg1["depth"].cpu(), 
-                                            torch.tensor(K, dtype=torch.float32).cpu(), w2c_2.cpu()
-                                            ).cpu().numpy().astype(np.float64)
-                    match0 = result['mkpt0'].cpu().numpy().astype(np.float64)
-                    R_third, t_third = opencv_to_pycolmap_pnp(world_points, match0, K, 
-                                                        view.image_width, view.image_height)
-                    rotError_third, transError_third = loc_utils.calculate_pose_errors(gt_R, gt_t, R_third.T, t_third)
-                    rotError_final, transError_final = rotError_third, transError_third
-                    ########################################################
-                    if args.match_type==8:
-                        update_R = R_third.T
-                        update_t = t_third.squeeze(-1)
-                        view.update_RT(update_R, update_t)
-                        render_pkg1 = render(view, gaussians, pipe_param, background)
-                        match_012_final = loc_utils.img_match_rival(gt_img0, render_pkg1["render"].unsqueeze(0), 
-                                                       encoder, matcher)
-                        result = match_012_final
-                        ###################
-                        w2c_2 = torch.eye(4, 4, device='cuda')
-                        w2c_2[:3, :3] = torch.from_numpy(update_R.T).float()
-                        w2c_2[:3, 3] = torch.from_numpy(update_t).float()
-                        world_points = project_2d_to_3d(result['mkpt1'].cpu(), render_pkg1["depth"].cpu(), 
-                                            torch.tensor(K, dtype=torch.float32).cpu(), w2c_2.cpu()
-                                            ).cpu().numpy().astype(np.float64)
-                        match0 = result['mkpt0'].cpu().numpy().astype(np.float64)
-                        R_fourth, t_fourth = opencv_to_pycolmap_pnp(world_points, match0, K, 
-                                                        view.image_width, view.image_height)
-                        rotError_four, transError_four = loc_utils.calculate_pose_errors(gt_R, gt_t, R_fourth.T, t_fourth)
-                        rotError_final, transError_final = rotError_four, transError_four
-                ########################################################
-                if match_folder_path is not None:
-                    if args.match_type==3 or args.match_type==4:
-                        result['img0'] = render_pkg0["render"].permute(1, 2, 0)
-                    elif args.match_type==5:
-                        result['img0'] = new_gtimg0.squeeze(0).permute(1, 2, 0)
-                    else:
-                        result['img0'] = gt_img0.squeeze(0).permute(1, 2, 0)
-                    ################
-                    result['img1'] = render_pkg1["render"].permute(1, 2, 0)
-                    ########################################################
-                    T0 = gt_extrinsic_matrix
-                    T1 = view.extrinsic_matrix
-                    T_0to1 = torch.tensor(np.matmul(T1, np.linalg.inv(T0)), dtype=torch.float)
-                    T_1to0 = T_0to1.inverse()
-                    K = torch.tensor((views[0].intrinsic_matrix).astype(np.float32))
-                    pose_data = {"K0": K, "K1": K,
-                        "T_0to1": T_0to1.float(),
-                        "T_1to0": T_1to0.float(), "identifiers": [f"{view.image_name}"],}
-                    ########################################################
-                    result.update(pose_data)
-                    compute_metrics(result)
-                    save_matchimg_th(result, 
-                        f'{match_folder_path}/{index}_{view.image_name}__' + 
-                        f'(T:{transError:.2f}_R:{rotError:.2f})__(T:{transError_final:.2f}_R:{rotError_final:.2f}).png',
-                        threshold=5e-5)
+                    w2c_2[:3, :3].copy_(torch.from_numpy(update_R.T))
+                    w2c_2[:3, 3].copy_(torch.from_numpy(update_t))
+                    world_points, match0 = unproject_matches(result, render_pkg1["depth"], K_gpu, w2c_2)
+                    R_fourth, t_fourth = solve_pnp("pycolmap", world_points, match0, K, view, args.ransac_iters)
+                    rotError_four, transError_four = loc_utils.calculate_pose_errors(gt_R, gt_t, R_fourth.T, t_fourth)
+                    rotError_final, transError_final = rotError_four, transError_four
+            ########################################################
+            if match_folder_path is not None:
+                if args.match_type==3 or args.match_type==4:
+                    result['img0'] = render_pkg0["render"].permute(1, 2, 0)
+                elif args.match_type==5:
+                    result['img0'] = new_gtimg0.squeeze(0).permute(1, 2, 0)
+                else:
+                    result['img0'] = gt_img0.squeeze(0).permute(1, 2, 0)
+                ################
+                result['img1'] = render_pkg1["render"].permute(1, 2, 0)
                 ########################################################
-                if render_folder_path is not None:
-                    ################ gt, rendergt 
-                    gt_img = gt_img0.squeeze(0).permute(1, 2, 0)
-                    render_img_gt = render_pkg0["render"].permute(1, 2, 0)
-                    ################
-                    render_img1 = render_pkg1["render"].permute(1, 2, 0)
-                    ################
-                    update_R = R_final.T
-                    update_t = t_final.squeeze(-1)
-                    new_view = copy.deepcopy(view)
-                    new_view.update_RT(update_R, update_t)
-                    render_pkg_final = render(new_view, gaussians, pipe_param, background)
-                    render_img_final = render_pkg_final["render"].permute(1, 2, 0)
-                    ################
-                    top = torch.cat((gt_img, render_img_gt), dim=1)
-                    bottom = torch.cat((render_img1, render_img_final), dim=1)
-                    combined = torch.cat((top, bottom), dim=0)
-                    ################
-                    combined_np = (combined * 255).clamp(0, 255).byte().detach().cpu().numpy()
-                    Image.fromarray(combined_np).save(f"{render_folder_path}/{index}_{view.image_name}__"+
-                                                      f"(T:{transError:.2f}_R:{rotError:.2f})__(T:{transError_final:.2f}_R:{rotError_final:.2f}).png" )
+                T0 = gt_extrinsic_matrix
+                T1 = view.extrinsic_matrix
+                T_0to1 = torch.tensor(np.matmul(T1, np.linalg.inv(T0)), dtype=torch.float)
+                T_1to0 = T_0to1.inverse()
+                K = torch.tensor((views[0].intrinsic_matrix).astype(np.float32))
+                pose_data = {"K0": K, "K1": K,
+                    "T_0to1": T_0to1.float(),
+                    "T_1to0": T_1to0.float(), "identifiers": [f"{view.image_name}"],}
                 ########################################################
+                result.update(pose_data)
+                compute_metrics(result)
+                save_matchimg_th(result, 
+                    f'{match_folder_path}/{index}_{view.image_name}__' + 
+                    f'(T:{transError:.2f}_R:{rotError:.2f})__(T:{transError_final:.2f}_R:{rotError_final:.2f}).png',
+                    threshold=5e-5)
+            ########################################################
+            if render_folder_path is not None:
+                ################ gt, rendergt 
+                gt_img = gt_img0.squeeze(0).permute(1, 2, 0)
+                render_img_gt = render_pkg0["render"].permute(1, 2, 0)
+                ################
+                render_img1 = render_pkg1["render"].permute(1, 2, 0)
+                ################
+                update_R = R_final.T
+                update_t = t_final.squeeze(-1)
+                new_view = copy.deepcopy(view)
+                new_view.update_RT(update_R, update_t)
+                render_pkg_final = render(new_view, gaussians, pipe_param, background, **no_maps)
+                render_img_final = render_pkg_final["render"].permute(1, 2, 0)
+                ################
+                top = torch.cat((gt_img, render_img_gt), dim=1)
+                bottom = torch.cat((render_img1, render_img_final), dim=1)
+                combined = torch.cat((top, bottom), dim=0)
+                ################
+                combined_np = (combined * 255).clamp(0, 255).byte().detach().cpu().numpy()
+                Image.fromarray(combined_np).save(f"{render_folder_path}/{index}_{view.image_name}__"+
+                                                  f"(T:{transError:.2f}_R:{rotError:.2f})__(T:{transError_final:.2f}_R:{rotError_final:.2f}).png" )
+            ########################################################
                 
+            elapsed_time = elapsed_since(start)
+            total_elapsed_time += elapsed_time
+            if args.verbose:
                 print(f"{index}, {view.image_name}")
                 print(f"Rotation Error: {rotError} deg")
                 print(f"Translation Error: {transError} cm")
@@ -308,35 +275,33 @@ def localize_set(args,
                     if args.match_type==8:
                         print(f"fourth Rotation Error: {rotError_four} deg")
                         print(f"fourth Translation Error: {transError_four} cm")
-                elapsed_time = time.time()-start
-                total_elapsed_time += elapsed_time
                 print(f"elapsed time: {elapsed_time}")
                 print()
-                if args.match_type==6 or args.match_type==7:
-                    log_all_err(all_err_log_path, index, view.image_name, 
-                            rotError, transError, rotError_two, transError_two,
-                            elapsed_time, 
-                            rotError_third=rotError_third, traError_third=transError_third)
-                elif args.match_type==8:
-                    log_all_err(all_err_log_path, index, view.image_name, 
-                            rotError, transError, rotError_two, transError_two,
-                            elapsed_time, 
-                            rotError_third=rotError_third, traError_third=transError_third,
-                            rotError_forth=rotError_four, traError_forth=transError_four)
-                else:
-                    log_all_err(all_err_log_path, index, view.image_name, 
-                            rotError, transError, rotError_two, transError_two,
-                            elapsed_time)
-                prior_rErr.append(rotError)
-                prior_tErr.append(transError)
-                rErrs.append(rotError_two)
-                tErrs.append(transError_two)
-                if args.match_type==6 or args.match_type==7 or args.match_type==8:
-                    third_rErr.append(rotError_third)
-                    third_tErr.append(transError_third)
-                    if args.match_type==8:
-                        fourth_rErr.append(rotError_four)
-                        fourth_tErr.append(transError_four)
+            if args.match_type==6 or args.match_type==7:
+                log_all_err(all_err_log_path, index, view.image_name, 
+                        rotError, transError, rotError_two, transError_two,
+                        elapsed_time, 
+                        rotError_third=rotError_third, traError_third=transError_third)
+            elif args.match_type==8:
+                log_all_err(all_err_log_path, index, view.image_name, 
+                        rotError, transError, rotError_two, transError_two,
+                        elapsed_time, 
+                        rotError_third=rotError_third, traError_third=transError_third,
+                        rotError_forth=rotError_four, traError_forth=transError_four)
+            else:
+                log_all_err(all_err_log_path, index, view.image_name, 
+                        rotError, transError, rotError_two, transError_two,
+                        elapsed_time)
+            prior_rErr.append(rotError)
+            prior_tErr.append(transError)
+            rErrs.append(rotError_two)
+            tErrs.append(transError_two)
+            if args.match_type==6 or args.match_type==7 or args.match_type==8:
+                third_rErr.append(rotError_third)
+                third_tErr.append(transError_third)
+                if args.match_type==8:
+                    fourth_rErr.append(rotError_four)
+                    fourth_tErr.append(transError_four)
     mean_elapsed_time = total_elapsed_time / len(rErrs)
     print('rot len: ',len(prior_rErr))
     print('final rot len: ', len(rErrs))
@@ -367,18 +332,29 @@ def localize(args, model_param:ModelParams, pipe_param:PipelineParams):
         "max_num_keypoints": args.max_num_kpt,
         "detection_threshold": args.sp_th,
     }
-    encoder = SuperPoint(conf).cuda().eval()
+    encoder = SuperPoint(conf).cuda().eval().to(memory_format=torch.channels_last)
     matcher = LightGlue({"filter_threshold": args.lg_th ,}).cuda().eval()
     ########################################################
-    encoder_state_dict = torch.load(args.ace_encoder_path, map_location="cpu")
-    head_state_dict = torch.load(args.ace_ckpt, map_location="cpu")
+    encoder_state_dict, head_state_dict = load_ace_state_dicts(args.ace_encoder_path, args.ace_ckpt)
     ace_network = Regressor.create_from_split_state_dict(encoder_state_dict, head_state_dict).cuda().eval()
+    if args.compile:
+        # no inductor cudagraphs, ace_pose_stream captures its own graph and its
+        # warmup calls trigger the compilation before the capture
+        ace_network = torch.compile(ace_network, mode="max-autotune-no-cudagraphs", dynamic=False)
+    for model in (encoder, matcher, ace_network):
+        model.requires_grad_(False)
     testset = CamLocDataset(
         Path(args.source_path) / "test",
         mode=0,
         image_height=480,
     )
-    ace_test_loader = DataLoader(testset, shuffle=False, num_workers=0)
+    # one ACE forward per 8 frames; workers decode / resize the next batch meanwhile
+    ace_test_loader = DataLoader(testset, batch_size=8, shuffle=False, num_workers=max(2, os.cpu_count() // 2),
+                                 pin_memory=True, persistent_workers=True, prefetch_factor=2)
+    # pinned query images so the per-frame upload can be non-blocking
+    for view in scene.getTestCameras():
+        if not view.original_image.is_cuda:
+            view.original_image = view.original_image.pin_memory()
     ########################################################
     match_type_dict = {
         0: "ours",
@@ -446,6 +422,8 @@ if __name__ == "__main__":
     parser.add_argument("--ransac_iters", default=20000, type=int)
     parser.add_argument("--stop_kpt_num", default=30, type=int)
     parser.add_argument("--pnp", default="pycolmap", type=str)
+    parser.add_argument("--verbose", action='store_true', help='Print the per-frame errors and timings.')
+    parser.add_argument("--compile", action='store_true', help='torch.compile the ACE regressor and the MLP.')
     parser.add_argument("--ace_encoder_path", 
         default="/home/koki/code/cc/feature_3dgs_2/data/ace/ace_encoder_pretrained.pt", type=str)
     args = get_combined_args(parser)
@@ -1,23 +1,18 @@
 import os
-import cv2
-import time
 import torch
-import dsacstar
 import numpy as np
 from pathlib import Path
 from data.ace.dataset import CamLocDataset
 from data.ace.ace_network import Regressor
 from argparse import ArgumentParser
 import utils.loc.loc_utils as loc_utils
-from torch.cuda.amp import autocast
 from scene_ori import Scene, GaussianModel
 from torch.utils.data import DataLoader
-from utils.graphics_utils import fov2focal
-from utils.loc.depth import project_2d_to_3d
+from utils.loc.ace_utils import load_ace_state_dicts, elapsed_since
+from z_localization._localize_core import ace_frames, apply_prior, unproject_matches, solve_pnp
 from gaussian_renderer.__init__ori import render
 from matchers.lightglue import LightGlue
 from encoders.superpoint.superpoint import SuperPoint
-from utils.loc.pycolmap_utils import opencv_to_pycolmap_pnp
 from arguments import ModelParams, PipelineParams, get_combined_args
 from matchers.mast3r.mast3r.model import AsymmetricMASt3R
 from matchers.LoFTR.utils.utils import load_LoFTR
@@ -31,140 +26,88 @@ def localize_set(model_path, name, views, gaussians, pipe_param, background,
     prior_rErr = []
     prior_tErr = []
     total_elapsed_time = 0
-    device = torch.device("cuda")
     scene_name = model_path.split('/')[-3]
     test_name = args.test_name
     print(scene_name)
     if args.save_match:
         match_folder = f'{model_path}/match_imgs/{test_name}'
         os.makedirs(match_folder, exist_ok=True)
-    with torch.no_grad():
-        for index, (image_B1HW, _, gt_pose_B44, _, intrinsics_B33, _, _, filenames) in enumerate(ace_test_loader):
-            view = views[index]
-            start = time.time()
-            gt_im = view.original_image[0:3, :, :].cuda().unsqueeze(0)
-            image_B1HW = image_B1HW.to(device, non_blocking=True)
-            K = np.eye(3)
-            focal_length = fov2focal(view.FoVx, view.image_width)
-            K[0, 0] = K[1, 1] = focal_length
-            K[0, 2] = view.image_width / 2
-            K[1, 2] = view.image_height / 2
+    # intrinsics per camera model and the prior pose are reused across frames
+    K_cache = {}
+    w2c = torch.eye(4, 4, device='cuda')
+    with torch.inference_mode():
+        # DSAC* of the next batch runs on worker threads while this one renders and matches
+        for index, view, gt_pose_44, dsac_future, start in ace_frames(views, ace_network, ace_test_loader):
+            gt_im = view.original_image[0:3, :, :].cuda(non_blocking=True).unsqueeze(0)
+            K, K_gpu = loc_utils.get_intrinsics(view, K_cache)
             gt_R = view.R # c2w rotation
             gt_t = view.T # w2c translation
-            # Predict scene coordinates.
-            with autocast(enabled=True):
-                scene_coordinates_B3HW = ace_network(image_B1HW)
-            scene_coordinates_B3HW = scene_coordinates_B3HW.float().cpu()
 
-            for _, (scene_coordinates_3HW, gt_pose_44, intrinsics_33, frame_path) in \
-                            enumerate(zip(scene_coordinates_B3HW, 
-                                          gt_pose_B44, intrinsics_B33, filenames)):
-                print(f"{index}, {view.image_name}")
-                focal_length = intrinsics_33[0, 0].item()
-                ppX = intrinsics_33[0, 2].item()
-                ppY = intrinsics_33[1, 2].item()
-                assert torch.allclose(intrinsics_33[0, 0], intrinsics_33[1, 1])
-                
-                frame_name = Path(frame_path).name
-                out_pose = torch.zeros((4, 4))
-
-                inlier_count = dsacstar.forward_rgb(
-                    scene_coordinates_3HW.unsqueeze(0),
-                    out_pose,
-                    64,
-                    10,
-                    focal_length,
-                    ppX,
-                    ppY,
-                    100,
-                    100,
-                    ace_network.OUTPUT_SUBSAMPLE,
-                )
-                # out_R = out_pose[0:3, 0:3].numpy()
-                # out_t = out_pose[0:3, 3].numpy()
-                rotError, transError = loc_utils.calculate_pose_errors_ace(
-                    gt_pose_44, out_pose)
+            out_pose = dsac_future.result()
+            # out_R = out_pose[0:3, 0:3].numpy()
+            # out_t = out_pose[0:3, 3].numpy()
+            rotError, transError = loc_utils.calculate_pose_errors_ace(
+                gt_pose_44, out_pose)
 
-                out_R = out_pose[0:3, 0:3].numpy() # c2w rotation
-                out_t = out_pose[0:3, 3].numpy() # c2w translation
+            apply_prior(view, out_pose, w2c)
 
-                R_inv = out_R.T # w2c rotation
-                t_inv = -R_inv @ out_t # w2c translation
-                w2c = torch.eye(4, 4, device='cuda')
-                w2c[:3, :3] = torch.from_numpy(R_inv).float()
-                w2c[:3, 3] = torch.from_numpy(t_inv).float()
-                view.update_RT(out_R, t_inv)
-
-                render_pkg = render(view, gaussians, pipe_param, background)
-                db_render = render_pkg["render"]
-                db_depth = render_pkg["depth"]
-                query_render = gt_im
-                result = None
-                if args.match_type==0:
-                    result = loc_utils.img_match_rival(query_render, db_render, encoder, matcher)
-                if args.match_type==1:
-                    rotError_final, transError_final = loc_utils.img_match_mast3r(query_render, db_render, matcher, 
-                                                             K, depth_map=db_depth, w2c=w2c, gt_pose_44=gt_pose_44)
-                if args.match_type==2:
-                    result = loc_utils.img_match_aspan(query_render, db_render, matcher,)
-                print(f"time 7: {time.time()-start}")
-                if result is not None:
-                    if result is None:
-                        prior_rErr.append(rotError)
-                        prior_tErr.append(transError)
-                        rErrs.append(rotError)
-                        tErrs.append(transError)
+            render_pkg = render(view, gaussians, pipe_param, background)
+            db_render = render_pkg["render"]
+            db_depth = render_pkg["depth"]
+            query_render = gt_im
+            result = None
+            if args.match_type==0:
+                result = loc_utils.img_match_rival(query_render, db_render, encoder, matcher)
+            if args.match_type==1:
+                rotError_final, transError_final = loc_utils.img_match_mast3r(query_render, db_render, matcher, 
+                                                         K, depth_map=db_depth, w2c=w2c, gt_pose_44=gt_pose_44)
+            if args.match_type==2:
+                result = loc_utils.img_match_aspan(query_render, db_render, matcher,)
+            if result is not None:
+                if result is None:
+                    prior_rErr.append(rotError)
+                    prior_tErr.append(transError)
+                    rErrs.append(rotError)
+                    tErrs.append(transError)
+                    if args.verbose:
                         print(f"Rotation Error: {rotError} deg")
                         print(f"Translation Error: {transError} cm")
-                        continue
-                    if not len(result['mkpt1'].cpu())>args.stop_kpt_num:
-                        prior_rErr.append(rotError)
-                        prior_tErr.append(transError)
-                        rErrs.append(rotError)
-                        tErrs.append(transError)
+                    continue
+                if not result['mkpt1'].shape[0]>args.stop_kpt_num:
+                    prior_rErr.append(rotError)
+                    prior_tErr.append(transError)
+                    rErrs.append(rotError)
+                    tErrs.append(transError)
+                    if args.verbose:
                         print(f"Rotation Error: {rotError} deg")
                         print(f"Translation Error: {transError} cm")
-                        total_elapsed_time += time.time()-start
-                        continue
-                    db_world = project_2d_to_3d(result['mkpt1'].cpu(), db_depth.cpu(), 
-                                                torch.tensor(K, dtype=torch.float32).cpu(), 
-                                                w2c.cpu()).cpu().numpy().astype(np.float64)
-                    q_matched = result['mkpt0'].cpu().numpy().astype(np.float64)
-                    if args.pnp == "iters":
-                        _, R_final, t_final, _ = cv2.solvePnPRansac(db_world, q_matched, K, distCoeffs=None, 
-                                                                    flags=cv2.SOLVEPNP_ITERATIVE, 
-                                                                    iterationsCount=args.ransac_iters)
-                        R_final, _ = cv2.Rodrigues(R_final)
-                    elif args.pnp == "epnp":
-                        _, R_final, t_final, _ = cv2.solvePnPRansac(db_world, q_matched, K, distCoeffs=None, 
-                                                                    flags=cv2.SOLVEPNP_EPNP)
-                        R_final, _ = cv2.Rodrigues(R_final)
-                    elif args.pnp == "pycolmap":
-                        R_final, t_final = opencv_to_pycolmap_pnp(db_world, q_matched, K, 
-                                                            view.image_width, view.image_height)
-                    rotError_final, transError_final = loc_utils.calculate_pose_errors(gt_R, gt_t, R_final.T, t_final)
+                    total_elapsed_time += elapsed_since(start)
+                    continue
+                db_world, q_matched = unproject_matches(result, db_depth, K_gpu, w2c)
+                R_final, t_final = solve_pnp(args.pnp, db_world, q_matched, K, view, args.ransac_iters)
+                rotError_final, transError_final = loc_utils.calculate_pose_errors(gt_R, gt_t, R_final.T, t_final)
 
-                    if args.save_match:
-                        result['img0'] = gt_im.squeeze(0).permute(1, 2, 0)
-                        result['img1'] = db_render.squeeze(0).permute(1, 2, 0)
-                        loc_utils.save_matchimg(result, 
-                            f'{match_folder}/{index}_{view.image_name}__(T:{transError:.2f}_R:{rotError:.2f})__(T:{transError_final:.2f}_R:{rotError_final:.2f}).png')
+                if args.save_match:
+                    result['img0'] = gt_im.squeeze(0).permute(1, 2, 0)
+                    result['img1'] = db_render.squeeze(0).permute(1, 2, 0)
+                    loc_utils.save_matchimg(result, 
+                        f'{match_folder}/{index}_{view.image_name}__(T:{transError:.2f}_R:{rotError:.2f})__(T:{transError_final:.2f}_R:{rotError_final:.2f}).png')
                 
-                # print(index)
+            elapsed_time = elapsed_since(start)
+            total_elapsed_time += elapsed_time
+            if args.verbose:
+                print(f"{index}, {view.image_name}")
                 print(f"Rotation Error: {rotError} deg")
                 print(f"Translation Error: {transError} cm")
-                # Print the errors
                 print(f"Final Rotation Error: {rotError_final} deg")
                 print(f"Final Translation Error: {transError_final} cm")
-                elapsed_time = time.time()-start
-                total_elapsed_time += elapsed_time
                 print(f"elapsed time: {elapsed_time}")
                 print()
-                # breakpoint()
-                prior_rErr.append(rotError)
-                prior_tErr.append(transError)
-                rErrs.append(rotError_final)
-                tErrs.append(transError_final)
+            # breakpoint()
+            prior_rErr.append(rotError)
+            prior_tErr.append(transError)
+            rErrs.append(rotError_final)
+            tErrs.append(transError_final)
     
     error_foler = f'{model_path}/error_logs/{test_name}'
     os.makedirs(error_foler, exist_ok=True)
@@ -190,7 +133,7 @@ def localize(model_param:ModelParams, pipe_param:PipelineParams, args):
         "detection_threshold": args.sp_th,
     }
     if args.match_type==0:
-        encoder = SuperPoint(conf).cuda().eval()
+        encoder = SuperPoint(conf).cuda().eval().to(memory_format=torch.channels_last)
         matcher = LightGlue({"filter_threshold": args.lg_th ,}).cuda().eval()
     elif args.match_type==1:
         model_name = "naver/MASt3R_ViTLarge_BaseDecoder_512_catmlpdpt_metric"
@@ -200,9 +143,15 @@ def localize(model_param:ModelParams, pipe_param:PipelineParams, args):
         encoder = None
         matcher = get_aspan(name="indoor")
     
-    encoder_state_dict = torch.load(args.ace_encoder_path, map_location="cpu")
-    head_state_dict = torch.load(args.ace_ckpt, map_location="cpu")
+    encoder_state_dict, head_state_dict = load_ace_state_dicts(args.ace_encoder_path, args.ace_ckpt)
     ace_network = Regressor.create_from_split_state_dict(encoder_state_dict, head_state_dict).cuda().eval()
+    if args.compile:
+        # no inductor cudagraphs, ace_pose_stream captures its own graph and its
+        # warmup calls trigger the compilation before the capture
+        ace_network = torch.compile(ace_network, mode="max-autotune-no-cudagraphs", dynamic=False)
+    for model in (encoder, matcher, ace_network):
+        if isinstance(model, torch.nn.Module):
+            model.requires_grad_(False)
     ########################################################
     scene_path = Path(args.source_path).parent
     ########################################################
@@ -211,7 +160,13 @@ def localize(model_param:ModelParams, pipe_param:PipelineParams, args):
         mode=0,  # Default for ACE, we don't need scene coordinates/RGB-D.
         image_height=480,
     )
-    testset_loader = DataLoader(testset, shuffle=False, num_workers=0)
+    # one ACE forward per 8 frames; workers decode / resize the next batch meanwhile
+    testset_loader = DataLoader(testset, batch_size=8, shuffle=False, num_workers=max(2, os.cpu_count() // 2),
+                                pin_memory=True, persistent_workers=True, prefetch_factor=2)
+    # pinned query images so the per-frame upload can be non-blocking
+    for view in scene.getTestCameras():
+        if not view.original_image.is_cuda:
+            view.original_image = view.original_image.pin_memory()
     localize_set(model_param.model_path, "test", scene.getTestCameras(), 
                  gaussians, pipe_param, background, args, encoder, matcher, ace_network, testset_loader)
 
@@ -231,6 +186,8 @@ if __name__ == "__main__":
     parser.add_argument("--pnp", default="iters", type=str)
     parser.add_argument("--test_name", required=True, type=str)
     parser.add_argument("--match_type", default=0, type=int)
+    parser.add_argument("--verbose", action='store_true', help='Print the per-frame errors and timings.')
+    parser.add_argument("--compile", action='store_true', help='torch.compile the ACE regressor.')
     parser.add_argument("--ace_encoder_path", 
                         default="/home/koki/code/cc/feature_3dgs_2/ace/ace_encoder_pretrained.pt", type=str)
     args = get_combined_args(parser)
@@ -1,131 +1,282 @@
+import io
 import os
+import mmap
+import struct
 import json
 import pickle
 import pprint
 import argparse
-from pathlib import Path
+import numpy as np
+from functools import partial
 from itertools import chain
+from collections import defaultdict, deque
 from datetime import datetime
-from utils.match.comm import gather
-from utils.match.metrics import aggregate_metrics
-from render import feature_visualize_saving
-import torch.utils.tensorboard as tensorboard
-from tensorboard.backend.event_processing.event_accumulator import EventAccumulator
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import orjson
+    ORJSON_FOUND = True
+except ImportError:
+    ORJSON_FOUND = False
+
+
+POSE_ERROR_KEYS = ('R_errs', 't_errs')
+BYTES_TO_MB = 1 / (1024 * 1024)
 
 
 def flattenList(x):
     return list(chain(*x))
 
 
-def get_elapsed_time_for_tag(log_dir, tag_name):
-    start_time = None
-    end_time = None
-    for root, _, files in os.walk(log_dir):
-        for file in files:
-            if file.startswith('events.out.tfevents'):
-                file_path = os.path.join(root, file)
-                event_acc = EventAccumulator(file_path)
-                event_acc.Reload()
-                if tag_name in event_acc.Tags().get('scalars', []):
-                    events = event_acc.Scalars(tag_name)
-                    start_time = datetime.fromtimestamp(events[0].wall_time) if start_time is None else start_time
-                    end_time = datetime.fromtimestamp(events[-1].wall_time)
-    if start_time and end_time:
-        elapsed_time = end_time - start_time
+def load_json(path):
+    if ORJSON_FOUND:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def fast_load(path):
+    # 1 MiB buffered reads keep the C unpickler from issuing many small reads
+    with io.BufferedReader(open(path, 'rb', buffering=0), buffer_size=1 << 20) as f:
+        return pickle.Unpickler(f).load()
+
+
+def record_spans(mm):
+    # TFRecord framing: uint64 length, uint32 length crc, payload, uint32 payload crc.
+    # The crcs are not checked (local files); a truncated last record ends the scan
+    off = 0
+    size = len(mm)
+    while off + 12 <= size:
+        n = struct.unpack_from('<Q', mm, off)[0]
+        if off + 12 + n + 4 > size:
+            break
+        yield off + 12, off + 12 + n
+        off += 12 + n + 4
+
+
+def scalar_wall_times(file_path, cache):
+    # {tag: (first_wall, last_wall)} of every scalar tag in one tfevents file; cache maps
+    # file_path -> ((mtime, size), tag_times) so unchanged files are never parsed again
+    stat = os.stat(file_path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = cache.get(file_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    # only a cache miss pays for importing tensorboard's protos
+    from tensorboard.compat.proto.event_pb2 import Event
+    # stream the records once; images / histograms are never decoded or kept
+    tag_times = {}
+    event = Event()
+    if stat.st_size:
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                memoryview(mm) as view:
+            for start, end in record_spans(mm):
+                event.ParseFromString(view[start:end])
+                wall_time = event.wall_time
+                for value in event.summary.value:
+                    if value.WhichOneof('value') == 'simple_value':
+                        # running min / max; only a record that moves an endpoint writes
+                        times = tag_times.get(value.tag)
+                        if times is None:
+                            tag_times[value.tag] = (wall_time, wall_time)
+                        elif wall_time > times[1] or wall_time < times[0]:
+                            tag_times[value.tag] = (min(times[0], wall_time), max(times[1], wall_time))
+    cache[file_path] = (key, tag_times)
+    return tag_times
+
+
+def event_files(log_dir):
+    # tfevents files of a run; they normally sit directly in the run folder
+    with os.scandir(log_dir) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from event_files(entry.path)
+            elif entry.name.startswith('events.out.tfevents'):
+                yield entry.path
+
+
+RUN_NAME_DIGITS = str.maketrans('', '', '_')
+
+
+def latest_run(run_paths):
+    # run folders are named by timestamp, the newest one has the largest digits
+    with os.scandir(run_paths) as entries:
+        return max(entries, key=lambda e: int(e.name.translate(RUN_NAME_DIGITS))).path
+
+
+def event_file_time(file_path):
+    # events.out.tfevents.<creation time>.<host>...
+    return int(os.path.basename(file_path).split('.')[3])
+
+
+def tag_wall_time(file_paths, tag_name, endpoint, cache):
+    # first (endpoint 0) / last (endpoint 1) wall time of the tag in the first file holding it
+    for file_path in file_paths:
+        try:
+            tag_times = scalar_wall_times(file_path, cache)
+        except FileNotFoundError:
+            # removed between listing and reading, e.g. a run being cleaned up
+            continue
+        if tag_name in tag_times:
+            return tag_times[tag_name][endpoint]
+    return None
+
+
+def get_elapsed_time_for_tag(log_dir, tag_name, cache_path=None):
+    # event files are time ordered, so only the first and the last file holding the
+    # tag are read, however many files the run rotated through. cache_path is one pickle
+    # for the whole run, kept outside the run folder so tensorboard never sees it
+    cache = fast_load(cache_path) if cache_path and os.path.exists(cache_path) else {}
+    cached = dict(cache)
+    files = sorted(event_files(log_dir), key=event_file_time)
+    first_wall = tag_wall_time(files, tag_name, 0, cache)
+    last_wall = tag_wall_time(reversed(files), tag_name, 1, cache)
+    if cache_path and cache != cached:
+        dump_atomic(cache, cache_path)
+    if first_wall is not None and last_wall is not None:
+        elapsed_time = datetime.fromtimestamp(last_wall) - datetime.fromtimestamp(first_wall)
         elapsed_time = int(elapsed_time.total_seconds())
         return elapsed_time
     else:
         return None
 
 
+def stat_key(*paths):
+    return tuple((st.st_mtime_ns, st.st_size) for st in map(os.stat, paths))
+
+
+def dump_atomic(obj, path):
+    # write then rename, so an interrupted run never leaves a half-written cache
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f, protocol=5)
+    os.replace(tmp_path, path)
+
+
+def scene_summary(path, scene_root, eval_pcd_size):
+    gs_size = None
+    run_path = latest_run(f"{scene_root}/runs")
+    if os.path.exists(f"{path}/training_time.pkl"):
+        elapsed_time = fast_load(f"{path}/training_time.pkl")
+    else:
+        elapsed_time = get_elapsed_time_for_tag(run_path, "iter_time", f"{scene_root}/tag_times.pkl")
+        dump_atomic(elapsed_time, f"{path}/training_time.pkl")
+    r_file = load_json(f"{path}/results.json")
+    ssim = r_file["ours_8000"]["SSIM"]
+    psnr = r_file["ours_8000"]["PSNR"]
+    lpips = r_file['ours_8000']['LPIPS']
+    if eval_pcd_size:
+        pcd_path = f"{scene_root}/point_cloud/iteration_8000/point_cloud.ply"
+        if os.path.exists(f"{path}/gs_size.pkl"):
+            gs_size = fast_load(f"{path}/gs_size.pkl")
+        else:
+            gs_size = os.path.getsize(pcd_path) * BYTES_TO_MB
+            dump_atomic(gs_size, f"{path}/gs_size.pkl")
+        print("size: ", gs_size)
+    print("time: ", elapsed_time)
+    return ssim, psnr, lpips, gs_size, elapsed_time
+
+
+def _process_one(path, eval_all, eval_pcd_size):
+    # everything compute_eval needs from one scene folder; runs in a worker process
+    print(path)
+    p_file = fast_load(f"{path}/matching.pkl")
+    if not eval_all:
+        return p_file, None, None, None, None, None
+    # (ssim, psnr, lpips, gs_size, elapsed_time) only change with their inputs
+    scene_root = os.path.dirname(os.path.dirname(path))
+    inputs = [f"{path}/results.json"]
+    if eval_pcd_size:
+        inputs.append(f"{scene_root}/point_cloud/iteration_8000/point_cloud.ply")
+    key = (stat_key(*inputs), eval_pcd_size)
+    summary_path = f"{path}/scene_summary.pkl"
+    if os.path.exists(summary_path):
+        cached_key, summary = fast_load(summary_path)
+        if cached_key == key:
+            return (p_file, *summary)
+    summary = scene_summary(path, scene_root, eval_pcd_size)
+    dump_atomic((key, summary), summary_path)
+    return (p_file, *summary)
+
+
+def bounded_map(pool, fn, items, max_pending):
+    # Executor.map submits every item up front; this keeps at most max_pending scenes
+    # in flight, so the folder generator is only advanced as results are consumed
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
 def compute_eval(all_path, save_path, out_name, match_name, eval_all=0, eval_pcd_size=0):
+    # pulls in torch / kornia; the pool workers and eval_raw_* never need it
+    from utils.match.metrics import aggregate_metrics
     all_path = all_path
     folders = os.listdir(all_path)
     folders = sorted(folders, key=lambda f: int(f[5:9]))
-    folders = [os.path.join(all_path, f, f"sfm_sample/outputs/{out_name}/{match_name}/LG") for f in folders]
-    aggregate_list = []
-    gauss_list = {
-        "ssim": 0,
-        "lpips": 0,
-        "psnr": 0,
-    }
+    folders = (f"{all_path}/{f}/sfm_sample/outputs/{out_name}/{match_name}/LG" for f in folders)
+    # per-pair metric values grouped by key as each scene arrives
+    per_key = defaultdict(list)
+    # running (ssim, psnr, lpips) sums
+    gauss_sum = np.zeros(3, dtype=np.float64)
     total_elapsed_time = 0
+    num_folders = 0
     num = 0
     if eval_pcd_size:
         total_gauss_size = 0
-    for idx, path in enumerate(folders):
-        print(idx, path)
-        with open(f"{path}/matching.pkl", 'rb') as f:
-            p_file = pickle.load(f)
-        aggregate_list.extend(p_file)
-        if eval_all:
-            run_paths = Path(path).parent.parent/"runs"
-            run_folds = os.listdir(run_paths)
-            run_folds = sorted(run_folds, key = lambda f:int(f.replace('_', '')))
-            run_fold = run_folds[-1]
-            run_path = run_paths/run_fold
-            if os.path.exists(f"{path}/training_time.pkl"):
-                with open(f"{path}/training_time.pkl", 'rb') as f:
-                    elapsed_time = pickle.load(f)
-            else:
-                elapsed_time = get_elapsed_time_for_tag(run_path, "iter_time")
-                with open(f"{path}/training_time.pkl", 'wb') as f:
-                    pickle.dump(elapsed_time, f)
-            total_elapsed_time = total_elapsed_time + elapsed_time
-            with open(f"{path}/results.json", 'r') as f:
-                r_file = json.load(f)
-                gauss_list['ssim'] += r_file["ours_8000"]["SSIM"]
-                gauss_list['psnr'] += r_file["ours_8000"]["PSNR"]
-                gauss_list['lpips'] += r_file['ours_8000']['LPIPS']
-            if eval_pcd_size:
-                pcd_path = str(Path(path).parent.parent/"point_cloud"/"iteration_8000"/"point_cloud.ply")
-                if os.path.exists(f"{path}/gs_size.pkl"):
-                    with open(f"{path}/gs_size.pkl", 'rb') as f:
-                        gs_size = pickle.load(f)
-                else:
-                    gs_size = os.path.getsize(pcd_path)/(1024 * 1024)
-                    with open(f"{path}/gs_size.pkl", 'wb') as f:
-                        pickle.dump(gs_size, f)
-                total_gauss_size += gs_size
-                num+=1
-                print("size: ", gs_size)
-            print("time: ", elapsed_time)
-
-    metrics = {k: flattenList(gather(flattenList([_me[k] for _me in aggregate_list]))) for k in aggregate_list[0]}
+    # scenes are independent, each worker decodes its own pickles / event files
+    process_one = partial(_process_one, eval_all=eval_all, eval_pcd_size=eval_pcd_size)
+    workers = os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # consumed in folder order; each scene's p_file is dropped once it is grouped
+        for p_file, ssim, psnr, lpips, gs_size, elapsed_time in bounded_map(pool, process_one, folders, 2 * workers):
+            num_folders += 1
+            for _me in p_file:
+                for k, v in _me.items():
+                    per_key[k].append(v)
+            if eval_all:
+                total_elapsed_time = total_elapsed_time + elapsed_time
+                gauss_sum += (ssim, psnr, lpips)
+                if eval_pcd_size:
+                    total_gauss_size += gs_size
+                    num+=1
+
+    # one pose error per pair, concatenated into flat arrays; the ragged per-pair arrays
+    # (epi_errs, inliers) and the identifiers stay lists. Single process, so no gather
+    metrics = {k: np.concatenate(v) if k in POSE_ERROR_KEYS else flattenList(v) for k, v in per_key.items()}
     val_metrics_4tb = aggregate_metrics(metrics, 5e-4)
     if eval_all:
-        avg_training_time = int(float(total_elapsed_time)/float(len(folders)))    
-        gauss_list['ssim'] /= len(folders)
-        gauss_list['psnr'] /= len(folders)
-        gauss_list['lpips'] /= len(folders)
+        avg_training_time = int(float(total_elapsed_time)/float(num_folders))    
+        gauss_list = dict(zip(("ssim", "psnr", "lpips"), (gauss_sum / num_folders).tolist()))
         if eval_pcd_size:
             avg_gs_size = total_gauss_size/ num
     
     
-    pprint.pprint(val_metrics_4tb)
+    # each structure is formatted once, for the console and the results file
+    metrics_txt = pprint.pformat(val_metrics_4tb)
+    print(metrics_txt)
+    lines = [metrics_txt]
     if eval_all:
-        pprint.pprint(gauss_list)
+        gauss_txt = pprint.pformat(gauss_list)
+        print(gauss_txt)
         print(avg_training_time)
         minutes, seconds = divmod(avg_training_time, 60)
         print(f"min:{minutes}, second:{seconds}")
+        lines.append(gauss_txt)
         if eval_pcd_size:
             print(avg_gs_size)
+            lines += ["gaussian size:", str(avg_gs_size)]
+        lines += ["training time:", str(avg_training_time), f"min:{minutes}, second:{seconds}"]
     
     os.makedirs(save_path, exist_ok=True)
     file_name = out_name.replace(':', '_')
     save_path = f"{save_path}/{file_name}.txt"
 
     with open(f'{save_path}', 'a') as file:
-        pp = pprint.PrettyPrinter(stream=file)
-        pp.pprint(val_metrics_4tb)
-        if eval_all:
-            pp.pprint(gauss_list)
-            if eval_pcd_size:
-                print("gaussian size:", file=file)
-                print(avg_gs_size, file=file)
-            print("training time:", file=file)
-            print(avg_training_time, file=file)
-            print(f"min:{minutes}, second:{seconds}", file=file)
+        file.write("\n".join(lines) + "\n")
 
 
 if __name__=="__main__":
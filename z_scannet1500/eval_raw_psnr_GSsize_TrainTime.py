@@ -1,9 +1,7 @@
 import os
-import json
 import pickle
 import pprint
-from pathlib import Path
-from z_scannet1500.eval_ours_all import get_elapsed_time_for_tag
+from z_scannet1500.eval_ours_all import get_elapsed_time_for_tag, latest_run, load_json, BYTES_TO_MB
 
 
 def compute_eval(out_name = "raw_imrate:1"):
@@ -21,26 +19,22 @@ def compute_eval(out_name = "raw_imrate:1"):
 
     for path in folders:
         print(path)
-        with open(f"{path}/results.json", 'r') as f:
-            r_file = json.load(f)
-            gauss_list['ssim'] += r_file["ours_8000"]["SSIM"]
-            gauss_list['psnr'] += r_file["ours_8000"]["PSNR"]
-            gauss_list['lpips'] += r_file['ours_8000']['LPIPS']
-        gs_size = os.path.getsize(str(Path(path).parent.parent/"point_cloud"/"iteration_8000"/"point_cloud.ply"))/(1024 * 1024)
+        r_file = load_json(f"{path}/results.json")
+        gauss_list['ssim'] += r_file["ours_8000"]["SSIM"]
+        gauss_list['psnr'] += r_file["ours_8000"]["PSNR"]
+        gauss_list['lpips'] += r_file['ours_8000']['LPIPS']
+        scene_root = os.path.dirname(os.path.dirname(path))
+        gs_size = os.path.getsize(f"{scene_root}/point_cloud/iteration_8000/point_cloud.ply") * BYTES_TO_MB
 
         gauss_size += gs_size
-        run_paths = Path(path).parent.parent/"runs"
-        run_folds = os.listdir(run_paths)
-        run_folds = sorted(run_folds, key = lambda f:int(f.replace('_', '')))
-
-        run_fold = run_folds[-1]
-        run_path = run_paths/run_fold
+        run_path = latest_run(f"{scene_root}/runs")
 
         if os.path.exists(f"{path}/training_time.pkl"):
             with open(f"{path}/training_time.pkl", 'rb') as f:
                 elapsed_time = pickle.load(f)
         else:
-            elapsed_time = get_elapsed_time_for_tag(run_path, "train_loss_patches/total_loss")
+            elapsed_time = get_elapsed_time_for_tag(run_path, "train_loss_patches/total_loss",
+                                                    f"{scene_root}/tag_times.pkl")
             with open(f"{path}/training_time.pkl", 'wb') as f:
                 pickle.dump(elapsed_time, f)
         total_elapsed_time = total_elapsed_time + elapsed_time
@@ -55,23 +49,18 @@ def compute_eval(out_name = "raw_imrate:1"):
     print(avg_training_time)
     minutes, seconds = divmod(avg_training_time, 60)
     print(minutes, seconds)
-    pprint.pprint(gauss_list)
+    gauss_txt = pprint.pformat(gauss_list)
+    print(gauss_txt)
 
     save_folder = f"/home/koki/code/cc/feature_3dgs_2/z_result"
     os.makedirs(save_folder, exist_ok=True)
     file_name = out_name.replace(':', '_')
     save_path = f"{save_folder}/{file_name}.txt"
 
+    lines = [gauss_txt, "gaussian size:", str(avg_gs_size),
+             "training time:", str(avg_training_time), f"min:{minutes}, second:{seconds}"]
     with open(f'{save_path}', 'a') as file:
-        pp = pprint.PrettyPrinter(stream=file)
-        pp.pprint(gauss_list)
-
-        print("gaussian size:", file=file)
-        print(avg_gs_size, file=file)
-        
-        print("training time:", file=file)
-        print(avg_training_time, file=file)
-        print(f"min:{minutes}, second:{seconds}", file=file)
+        file.write("\n".join(lines) + "\n")
 
 
 # python compute_eval_image.py
@@ -4,8 +4,8 @@ import pprint
 import pickle
 import numpy as np
 from PIL import Image
-from copy import deepcopy
 from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 from utils.match.comm import gather
 from dataclasses import dataclass
 from utils.match.metrics import aggregate_metrics
@@ -33,30 +33,26 @@ def dump_pair():
     path = "/home/koki/code/cc/feature_3dgs_2/img_match/scannet_test_1500_info/test.npz"
     x = dict(np.load(path))
     z=x['name']
-    pair_dict = {}
-    leng = int(len(z)/15)
-    for i in range(leng):
-        pairs = z[15*i: 15*(i+1), 2:]
-        pair_dict[int(z[15 *i, 0])-707] = pairs
+    # 15 consecutive pairs per scene
+    grouped = z.reshape(-1, 15, z.shape[1])
+    scene_ids = grouped[:, 0, 0].astype(int) - 707
+    pair_dict = {int(sid): grouped[i, :, 2:] for i, sid in enumerate(scene_ids)}
     intrin = dict(np.load("/home/koki/code/cc/feature_3dgs_2/img_match/scannet_test_1500_info/intrinsics.npz"))
 
 
 def read_mat_txt(path):
-    with open(path, 'r') as file:
-        data = file.read().split()
-        data = [float(f) for f in data]
-        mat = np.array(data).reshape((4,4))
-    return mat
+    return np.loadtxt(path).reshape((4,4))
 
 
 def c2w_to_w2c(T_cw):
-    R = T_cw[:3, :3]
-    t = T_cw[:3, 3]
-    R_inv = R.T        
-    t_inv = -R_inv @ t
-    T_wc = np.eye(4)
-    T_wc[:3, :3] = R_inv
-    T_wc[:3, 3] = t_inv
+    # rigid inverse, works on a single 4x4 or a stack of [..., 4, 4]
+    R = T_cw[..., :3, :3]
+    t = T_cw[..., :3, 3]
+    R_inv = np.swapaxes(R, -1, -2)
+    t_inv = -np.einsum('...ij,...j->...i', R_inv, t)
+    T_wc = np.broadcast_to(np.eye(4), T_cw.shape).copy()
+    T_wc[..., :3, :3] = R_inv
+    T_wc[..., :3, 3] = t_inv
     return T_wc
 
 
@@ -89,13 +85,10 @@ def match_eval(args):
     scene_out = f"{scene_path}/sfm_sample/outputs/{out_name}/rendering/pairs/ours_8000"
     scene_pair = f"{scene_path}/test_pairs/pose"
     intrin = read_intrinsics_binary(f"{scene_path}/sfm_sample/sparse/0/cameras.bin")[1]
-    K = np.zeros((3, 3))
-    K[0, 0] = intrin.params[0]
-    K[1, 1] = intrin.params[1]
-    K[0, 2] = intrin.params[2]
-    K[1, 2] = intrin.params[3]
-    K[2, 2] = 1.
-    K = torch.tensor(K).float()
+    fx, fy, cx, cy = intrin.params[:4]
+    K = torch.tensor([[fx, 0., cx],
+                      [0., fy, cy],
+                      [0., 0., 1.]], dtype=torch.float32)
 
     if args.resize_num==2:
         K[:2, :] = K[:2, :] * 0.5
@@ -119,29 +112,57 @@ def match_eval(args):
             match_result = f"{scene_path}/sfm_sample/outputs/{out_name}/{args.match_name}/SG"
             os.makedirs(f"{match_result}/images", exist_ok=True)
         poses = read_pose(scene_pair)
+        pose_ids = list(poses)
+        w2c = dict(zip(pose_ids, c2w_to_w2c(np.stack([poses[i] for i in pose_ids]))))
         pairs = my_dict[scene_num]
         leng = len(pairs)
         txt_file = f"{match_result}/out.txt"
         if os.path.exists(txt_file):
             os.remove(txt_file)
 
+        # each rendered view appears in several pairs; load its maps to GPU once
+        unique_ids = {int(p) for pair in pairs for p in pair[:2]}
+        feats = {i: {"s": torch.load(f"{scene_out}/score_tensors/{i}_smap.pt", map_location="cuda").float(),
+                     "f": torch.load(f"{scene_out}/feature_tensors/{i}_fmap.pt", map_location="cuda").float()}
+                 for i in unique_ids}
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+            imgs = dict(zip(unique_ids, pool.map(
+                lambda i: np.array(Image.open(f"{scene_out}/image_renders/{i}.png")), unique_ids)))
+
+        def post_process(data_fm, done, fm_name, fm_path):
+            done.synchronize()
+            compute_metrics(data_fm)
+            print_eval_to_file(data_fm, fm_name, threshold=5e-4, file_path=txt_file)
+            data_fm["matcher"] = "ours+LG"
+            if args.save_img:
+                save_matchimg_th(data_fm, fm_path)
+            keys = ['epi_errs', 'R_errs', 't_errs', 'inliers', 'identifiers']
+            eval_data = {}
+            for k in keys:
+                eval_data[k] = data_fm[k]
+            return eval_data
+
+        # match on a side stream while one worker does the CPU metrics / file
+        # writes of the previous pair, in pair order
+        compute_stream = torch.cuda.Stream()
+        compute_stream.wait_stream(torch.cuda.current_stream())
+        io_executor = ThreadPoolExecutor(max_workers=1)
+        futures = []
         for idx in range(leng):
-            data = {}
             pair = pairs[idx]
-            T0 = c2w_to_w2c(poses[int(pair[0])])
-            T1 = c2w_to_w2c(poses[int(pair[1])])
-            img0 = np.array(Image.open(f"{scene_out}/image_renders/{pair[0]}.png"))
-            img1 = np.array(Image.open(f"{scene_out}/image_renders/{pair[1]}.png"))
+            T0 = w2c[int(pair[0])]
+            T1 = w2c[int(pair[1])]
+            img0 = imgs[int(pair[0])]
+            img1 = imgs[int(pair[1])]
 
-            s0 = torch.load(f"{scene_out}/score_tensors/{pair[0]}_smap.pt").float()
-            s1 = torch.load(f"{scene_out}/score_tensors/{pair[1]}_smap.pt").float()
-            f0 = torch.load(f"{scene_out}/feature_tensors/{pair[0]}_fmap.pt").float()
-            f1 = torch.load(f"{scene_out}/feature_tensors/{pair[1]}_fmap.pt").float()
+            s0, f0 = feats[int(pair[0])]["s"], feats[int(pair[0])]["f"]
+            s1, f1 = feats[int(pair[1])]["s"], feats[int(pair[1])]["f"]
 
-            T_0to1 = torch.tensor(np.matmul(T1, np.linalg.inv(T0)), dtype=torch.float)
+            T_0to1 = torch.tensor(np.matmul(T1, c2w_to_w2c(T0)), dtype=torch.float)
             T_1to0 = T_0to1.inverse()
             fm_name = f"{scene_path}_score_feature_{idx}_{pair[0]}_{pair[1]}"
-            data = {
+            # matching and metrics only add keys, so the pair dict is used as-is
+            data_fm = {
                 "img0": img0,
                 "img1": img1,
                 "s0": s0,
@@ -154,19 +175,16 @@ def match_eval(args):
                 "T_1to0": T_1to0,
                 "identifiers": [fm_name],
             }
-            data_fm = deepcopy(data)
-            _ = score_feature_match(data_fm, args=args, matcher=matcher, mlp=mlp)
+            with torch.cuda.stream(compute_stream):
+                _ = score_feature_match(data_fm, args=args, matcher=matcher, mlp=mlp)
+            done = torch.cuda.Event()
+            done.record(compute_stream)
             fm_path = f"{match_result}/images/{idx}_score_feature_{pair[0]}_{pair[1]}.png"
-            compute_metrics(data_fm)
-            print_eval_to_file(data_fm, fm_name, threshold=5e-4, file_path=txt_file)
-            data_fm["matcher"] = "ours+LG"
-            if args.save_img:
-                save_matchimg_th(data_fm, fm_path)
-            keys = ['epi_errs', 'R_errs', 't_errs', 'inliers', 'identifiers']
-            eval_data = {}
-            for k in keys:
-                eval_data[k] = data_fm[k]
-            aggregate_list.append(eval_data)
+            futures.append(io_executor.submit(post_process, data_fm, done, fm_name, fm_path))
+        for future in futures:
+            aggregate_list.append(future.result())
+        torch.cuda.synchronize()
+        io_executor.shutdown(wait=True)
         metrics = {k: flattenList(gather(flattenList([_me[k] for _me in aggregate_list]))) for k in aggregate_list[0]}
         val_metrics_4tb = aggregate_metrics(metrics, 5e-4)
         print(f"{scene_path}")
@@ -176,7 +194,7 @@ def match_eval(args):
         with open(txt_file, 'a') as file:
             file.write(formatted_metrics)
         with open(f'{match_result}/matching.pkl', 'wb') as file:
-            pickle.dump(aggregate_list, file)
+            pickle.dump(aggregate_list, file, protocol=5)
     return aggregate_list
     
 
@@ -70,10 +70,10 @@ def read_data(scene_out, pair, intrin, poses):
 
     sp0 = f"{scene_out}/score_tensors/{pair[0]}_smap.pt"
     if os.path.exists(sp0):
-        s0 = torch.load(sp0).float()
-        s1 = torch.load(f"{scene_out}/score_tensors/{pair[1]}_smap.pt").float()
-        f0 = torch.load(f"{scene_out}/feature_tensors/{pair[0]}_fmap.pt").float()
-        f1 = torch.load(f"{scene_out}/feature_tensors/{pair[1]}_fmap.pt").float()
+        s0 = torch.load(sp0, map_location="cuda").float()
+        s1 = torch.load(f"{scene_out}/score_tensors/{pair[1]}_smap.pt", map_location="cuda").float()
+        f0 = torch.load(f"{scene_out}/feature_tensors/{pair[0]}_fmap.pt", map_location="cuda").float()
+        f1 = torch.load(f"{scene_out}/feature_tensors/{pair[1]}_fmap.pt", map_location="cuda").float()
     else:
         s0, s1, f0, f1 = None, None, None, None
 